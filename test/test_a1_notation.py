@@ -0,0 +1,133 @@
+import pytest
+
+from transfer_flatfile_format.packages.a1_notation import (
+    column_letter, column_number, build_column_table, build_range,
+    build_row_range, parse_range, merge_cell_updates, split_cell_updates,
+    chunk_cell_updates
+)
+
+def test_column_letter():
+    expect = ['A', 'Z', 'AA', 'AB', 'ZZ', 'AAA', 'XFD']
+    result = []
+
+    sample_input = [0, 25, 26, 27, 701, 702, 16383]
+
+    for i in sample_input:
+        result.append(column_letter(column_enum=i))
+
+    assert expect == result
+
+def test_column_number_roundtrip():
+    for i in range(0, 20000, 7):
+        assert column_number(column_letter(i)) == i
+    assert column_number('ab') == 27
+
+def test_column_number_invalid():
+    with pytest.raises(ValueError):
+        column_number('A1')
+
+def test_build_column_table():
+    table = build_column_table(width=800)
+
+    assert len(table) == 800
+    assert table[0] == 'A'
+    assert table[701] == 'ZZ'
+    assert table[702] == 'AAA'
+
+def test_build_range():
+    expect = ['B4', 'A1:E5', 'C:C', "'My Sheet'!A1:B2", 'Sheet1!AAA10']
+    result = [
+        build_range(start_col=1, start_row=4),
+        build_range(start_col=0, start_row=1, end_col=4, end_row=5),
+        build_range(start_col=2, end_col=2),
+        build_range(start_col=0, start_row=1, end_col=1, end_row=2,
+                    sheet='My Sheet'),
+        build_range(start_col=702, start_row=10, sheet='Sheet1')
+    ]
+
+    assert expect == result
+
+def test_parse_range():
+    expect = {'sheet': "Bob's list", 'start_col': 1, 'start_row': 3,
+              'end_col': 702, 'end_row': 10}
+
+    assert expect == parse_range("'Bob''s list'!B3:AAA10")
+    assert parse_range('D7') == {'sheet': '', 'start_col': 3,
+                                 'start_row': 7, 'end_col': 3, 'end_row': 7}
+    assert parse_range('Sheet1!A:C') == {'sheet': 'Sheet1', 'start_col': 0,
+                                         'start_row': None, 'end_col': 2,
+                                         'end_row': None}
+
+def test_parse_range_invalid():
+    with pytest.raises(ValueError):
+        parse_range('Sheet1!')
+
+def test_merge_cell_updates():
+    cells = {
+        (3, 1): 'a', (3, 2): 'b',
+        (4, 1): 'c', (4, 2): 'd',
+        (5, 1): 'e',
+        (7, 4): 'f'
+    }
+    expect = [
+        {'range': 'B4:C5', 'values': [['a', 'b'], ['c', 'd']]},
+        {'range': 'B6', 'values': [['e']]},
+        {'range': 'E8', 'values': [['f']]}
+    ]
+
+    assert expect == merge_cell_updates(cells=cells)
+
+def test_split_cell_updates():
+    data = [
+        {'range': 'B4:C5', 'values': [['a', 'b'], ['c']]},
+        {'range': 'E8', 'values': [['f']]}
+    ]
+    expect = {
+        (3, 1): 'a', (3, 2): 'b', (4, 1): 'c', (4, 2): '', (7, 4): 'f'
+    }
+
+    assert expect == split_cell_updates(data=data)
+
+def test_build_row_range():
+    assert build_row_range(start_row=1, end_row=2400) == '1:2400'
+    assert build_row_range(start_row=3, end_row=3, sheet='My Sheet') ==\
+        "'My Sheet'!3:3"
+    assert parse_range('1:2400')['end_row'] == 2400
+
+def test_chunk_cell_updates():
+    data = [
+        {'range': 'B2', 'values': [['a']]},
+        {'range': 'B4:C7', 'values': [['b', 'c'], ['d', 'e'], ['f', 'g'],
+                                      ['h', 'i']]}
+    ]
+    expect = [
+        [{'range': 'B2', 'values': [['a']]},
+         {'range': 'B4:C5', 'values': [['b', 'c'], ['d', 'e']]}],
+        [{'range': 'B6:C7', 'values': [['f', 'g'], ['h', 'i']]}]
+    ]
+
+    assert chunk_cell_updates(data=data, max_cells=5) == expect
+
+def test_chunk_cell_updates_wide_row():
+    data = [{'range': 'A1:E1', 'values': [['a', 'b', 'c', 'd', 'e']]}]
+    expect = [
+        [{'range': 'A1:B1', 'values': [['a', 'b']]}],
+        [{'range': 'C1:D1', 'values': [['c', 'd']]}],
+        [{'range': 'E1', 'values': [['e']]}]
+    ]
+
+    assert chunk_cell_updates(data=data, max_cells=2) == expect
+
+def test_chunk_cell_updates_large_range():
+    cells = {(row, col): 'x' for row in range(3, 2003) for col in range(160)}
+    data = merge_cell_updates(cells=cells)
+
+    chunks = chunk_cell_updates(data=data, max_cells=3000)
+
+    # 18 complete rows of 160 cells fit into a chunk
+    assert len(data) == 1
+    assert len(chunks) == 112
+    assert max(sum(len(row) for item in chunk for row in item['values'])
+               for chunk in chunks) <= 3000
+    assert split_cell_updates(
+        data=[item for chunk in chunks for item in chunk]) == cells
@@ -3,9 +3,11 @@ import pandas
 import numpy as np
 from pandas.testing import assert_frame_equal
 
-from transfer_flatfile_format.cli import (
-    create_match_table, find_match
+from transfer_flatfile_format.engine import (
+    create_match_table, locate_source_rows,
+    transfer_from_original
 )
+from transfer_flatfile_format.packages.sku_index import build_sku_index
 
 @pytest.fixture
 def sample_google_sheet():
@@ -86,22 +88,59 @@ def test_create_match_table(sample_google_sheet, sample_intern_list):
     ]
     expect = pandas.DataFrame(expect, columns=['item_sku', 'alt_sku'])
 
+    config = {'main_sku': 'Variation.number',
+              'alt_sku': 'Variation.externalId'}
+
     result = create_match_table(sheet=sample_google_sheet,
-                                intern_list=sample_intern_list)
+                                intern_list=sample_intern_list,
+                                config=config)
 
     assert_frame_equal(expect, result)
 
-def test_find_match(sample_google_sheet_small, sample_original_format,
-                    sample_match_table):
-    expect = ['a', 'b', '', '', '', '', 'g', 'h', '']
-    result = []
-
-    iterator = sample_google_sheet_small.iterrows()
+def test_locate_source_rows(sample_google_sheet_small, sample_original_format,
+                            sample_match_table):
+    options = {'rules': [], 'suffix_pattern': '', 'fuzzy': False,
+               'min_confidence': 0.8}
+    index = build_sku_index(skus=sample_original_format['item_sku'],
+                            options=options)
+    expect = pandas.DataFrame(
+        [[0, '1234x', 1.0, 'exact'], [-1, '', 0.0, ''],
+         [2, '2347x', 1.0, 'exact']],
+        columns=['position', 'source_sku', 'confidence', 'method'])
+
+    result = locate_source_rows(gsheet=sample_google_sheet_small,
+                                source=sample_original_format,
+                                match_table=sample_match_table, index=index)
 
-    for row in iterator:
-        for header in ['test2', 'test3', 'test4']:
-            result.append(find_match(row[1].item_sku, header,
-                                     sample_original_format,
-                                     sample_match_table))
+    assert_frame_equal(expect, result)
 
-    assert expect == result
+def test_transfer_from_original(sample_google_sheet_small,
+                                sample_original_format, sample_match_table):
+    expect = pandas.DataFrame(
+        [['1234x', 'abc', 'a', 'b', ''], ['1235x', '', '', '', ''],
+         ['1236x', 'abc2', 'g', 'h', '']],
+        columns=['item_sku', 'test', 'test2', 'test3', 'test4'])
+
+    result = transfer_from_original(gsheet=sample_google_sheet_small,
+                                    source=sample_original_format,
+                                    match_table=sample_match_table,
+                                    exclude=[])
+
+    assert_frame_equal(expect, result, check_dtype=False)
+
+def test_transfer_from_original_column_map(sample_google_sheet_small,
+                                           sample_original_format,
+                                           sample_match_table):
+    expect = pandas.DataFrame(
+        [['1234x', 'abc', 'a', 'a', 'b'], ['1235x', '', '', '', ''],
+         ['1236x', 'abc2', 'g', 'g', 'h']],
+        columns=['item_sku', 'test', 'test2', 'test3', 'test4'])
+    column_map = {'test': 'test', 'test2': 'test2', 'test3': 'test2',
+                  'test4': 'test3'}
+
+    result = transfer_from_original(gsheet=sample_google_sheet_small,
+                                    source=sample_original_format,
+                                    match_table=sample_match_table,
+                                    exclude=[], column_map=column_map)
+
+    assert_frame_equal(expect, result, check_dtype=False)
@@ -0,0 +1,62 @@
+import configparser
+import pytest
+
+from transfer_flatfile_format.packages.column_mapping import (
+    get_column_mapping, resolve_column_map
+)
+
+@pytest.fixture
+def sample_mapping_file(tmp_path):
+    path = tmp_path / 'mapping.csv'
+    path.write_text('sheet;source;regex\n'
+                    r'bullet_point(\d);bullet_point_\1;y' '\n'
+                    'main_image_url;image_url;n\n')
+    return str(path)
+
+@pytest.fixture
+def sample_config(sample_mapping_file):
+    config = configparser.ConfigParser()
+    config.read_string('[Column_mapping]\n'
+                       f'file={sample_mapping_file}\n'
+                       'item_name=title,product_name\n')
+    return config
+
+def test_get_column_mapping(sample_config):
+    result = get_column_mapping(config=sample_config)
+
+    assert result['aliases'] == {'item_name': ['title', 'product_name'],
+                                 'main_image_url': ['image_url']}
+    assert len(result['patterns']) == 1
+    assert result['patterns'][0][1] == r'bullet_point_\1'
+
+def test_get_column_mapping_empty():
+    assert get_column_mapping(config=configparser.ConfigParser()) ==\
+        {'aliases': {}, 'patterns': []}
+
+def test_get_column_mapping_percent():
+    config = configparser.ConfigParser()
+    config.read_string('[Column_mapping]\n'
+                       'discount=discount_%,rebate\n')
+
+    assert get_column_mapping(config=config)['aliases'] ==\
+        {'discount': ['discount_%', 'rebate']}
+
+def test_resolve_column_map(sample_config):
+    sheet_columns = ['item_name', 'brand_name', 'bullet_point1',
+                     'bullet_point2', 'bullet_point3', 'main_image_url',
+                     'unknown']
+    source_columns = ['item_sku', 'product_name', 'brand_name',
+                      'bullet_point_1', 'bullet_point_2', 'bullet_point3',
+                      'image_url']
+    expect = {
+        'item_name': 'product_name', 'brand_name': 'brand_name',
+        'bullet_point1': 'bullet_point_1', 'bullet_point2': 'bullet_point_2',
+        'bullet_point3': 'bullet_point3', 'main_image_url': 'image_url'
+    }
+
+    result = resolve_column_map(sheet_columns=sheet_columns,
+                                source_columns=source_columns,
+                                mapping=get_column_mapping(
+                                    config=sample_config))
+
+    assert expect == result
@@ -0,0 +1,267 @@
+import configparser
+import subprocess
+import sys
+import pytest
+import pandas
+
+from transfer_flatfile_format.engine import TransferEngine, TransferError
+from transfer_flatfile_format.packages.run_log import (
+    record_run, get_run, get_run_changes, get_runs, build_inverse_changes
+)
+from transfer_flatfile_format.packages.google_sheet import GoogleSheet
+
+class FakeSheet:
+    """ Sheet access returning fixed data and recording the writes """
+    def __init__(self, frame):
+        self.frame = frame
+        self.sheet_id = 'abc'
+        self.written = []
+
+    def read(self, column=None):
+        return self.frame.copy()
+
+    def write(self, data, snapshot=None):
+        self.written.append(data)
+        return []
+
+class FailingResource:
+    """ Spreadsheets resource with fixed values, failing on a batchUpdate """
+    def __init__(self, fail_at=None, current=None):
+        self.fail_at = fail_at
+        self.current = current or {}
+        self.updates = []
+
+    def values(self):
+        return self
+
+    def batchGet(self, spreadsheetId, ranges):
+        self.result = {'valueRanges': [
+            {'range': r, 'values': self.current[r]} if r in self.current
+            else {'range': r} for r in ranges
+        ]}
+        return self
+
+    def batchUpdate(self, spreadsheetId, body):
+        if len(self.updates) + 1 == self.fail_at:
+            raise ConnectionError('connection lost')
+        self.updates.append(body['data'])
+        self.result = {'totalUpdatedRows': len(body['data'])}
+        return self
+
+    def execute(self):
+        return self.result
+
+@pytest.fixture
+def sample_run_log(tmp_path):
+    path = str(tmp_path / 'run_log.sqlite')
+    changes = [
+        {'row': 3, 'column_index': 1, 'sku': '1234x', 'column': 'item_name',
+         'old': '', 'new': 'Shirt'},
+        {'row': 3, 'column_index': 2, 'sku': '1234x', 'column': 'price',
+         'old': '', 'new': '10'},
+        {'row': 4, 'column_index': 1, 'sku': '1235x', 'column': 'item_name',
+         'old': 'Cup', 'new': 'Mug'},
+        {'row': 4, 'column_index': 2, 'sku': '1235x', 'column': 'price',
+         'old': None, 'new': '5'}
+    ]
+    record_run(path=path, sheet_id='abc', source='source.csv',
+               mode='transfer', changes=changes)
+    return path
+
+@pytest.fixture
+def sample_incomplete_sheet():
+    llist = [
+        ['1234x', '', '', 3],
+        ['1235x', '', '', 4],
+        ['9999x', '', '', 5]
+    ]
+
+    return pandas.DataFrame(llist, columns=['item_sku', 'item_name',
+                                            'price', 'index'])
+
+@pytest.fixture
+def sample_source_file(tmp_path):
+    path = tmp_path / 'source.csv'
+    path.write_text('item_sku;product_name;price\n'
+                    '1234x;Shirt;10\n'
+                    '1235x;Mug;0\n')
+    return str(path)
+
+@pytest.fixture
+def sample_config():
+    config = configparser.ConfigParser()
+    config.read_string('[Column_mapping]\n'
+                       'item_name=product_name\n'
+                       '[Adjust]\n'
+                       'command=(X)*2\n')
+    return config
+
+def test_run(sample_incomplete_sheet, sample_source_file, sample_config):
+    engine = TransferEngine(config=sample_config)
+    sheet = FakeSheet(frame=sample_incomplete_sheet)
+    expect = [
+        {'range': 'B4:C6', 'values': [['Shirt', '10'], ['Mug', ''],
+                                      ['', '']]}
+    ]
+
+    result = engine.run(sheet=sheet, source=sample_source_file)
+
+    assert sheet.written == [expect]
+    assert result['updates'] == expect
+    assert result['column_map'] == {'item_name': 'product_name',
+                                    'price': 'price'}
+    assert result['stats']['rows'] == 3
+    assert result['stats']['matched'] == 2
+    assert result['stats']['cells'] == 6
+    assert result['snapshot'][(3, 1)] == ''
+    assert result['changes'] == [
+        {'row': 3, 'column_index': 1, 'sku': '1234x', 'column': 'item_name',
+         'old': '', 'new': 'Shirt'},
+        {'row': 3, 'column_index': 2, 'sku': '1234x', 'column': 'price',
+         'old': '', 'new': '10'},
+        {'row': 4, 'column_index': 1, 'sku': '1235x', 'column': 'item_name',
+         'old': '', 'new': 'Mug'}
+    ]
+
+def test_run_logged(sample_incomplete_sheet, sample_source_file,
+                    sample_config, tmp_path):
+    path = str(tmp_path / 'run_log.sqlite')
+    engine = TransferEngine(config=sample_config, run_log=path)
+    sheet = FakeSheet(frame=sample_incomplete_sheet)
+
+    result = engine.run(sheet=sheet, source=sample_source_file)
+    run = get_run(path=path, run_id=result['run_id'])
+    changes = get_run_changes(path=path, run_id=result['run_id'])
+
+    assert run['sheet_id'] == 'abc'
+    assert run['source'] == sample_source_file
+    assert run['mode'] == 'transfer'
+    assert changes['new_value'].tolist() == ['Shirt', '10', 'Mug']
+
+def test_run_logged_failed_chunk(sample_source_file, sample_config,
+                                 tmp_path):
+    path = str(tmp_path / 'run_log.sqlite')
+    engine = TransferEngine(config=sample_config, run_log=path)
+    resource = FailingResource(fail_at=2)
+    sheet = GoogleSheet(creds=None, sheet_id='abc', sheet=resource,
+                        chunk_size=2)
+    gsheet = pandas.DataFrame([['1234x', '', '', 3], ['1235x', '', '', 6]],
+                              columns=['item_sku', 'item_name', 'price',
+                                       'index'])
+    result = engine.transfer(gsheet=gsheet, source=sample_source_file)
+
+    with pytest.raises(ConnectionError):
+        engine.write(sheet=sheet, result=result)
+
+    run = get_runs(path=path).iloc[0]
+    (inverse, _) = build_inverse_changes(path=path,
+                                         run_id=int(run['run_id']))
+    assert resource.updates == [[{'range': 'B4:C4',
+                                  'values': [['Shirt', '10']]}]]
+    assert run['status'] == 'failed'
+    assert run['changes'] == 3
+    assert [(x['row'], x['column_index'], x['new']) for x in inverse] == [
+        (3, 1, ''), (3, 2, ''), (6, 1, '')
+    ]
+
+def test_run_column_adjust(sample_incomplete_sheet, sample_source_file,
+                           sample_config):
+    engine = TransferEngine(config=sample_config)
+    frame = pandas.DataFrame(
+        [['1234x', '5', 3, 2], ['1235x', '', 4, 2]],
+        columns=['item_sku', 'value', 'index', 'column_index'])
+    sheet = FakeSheet(frame=frame)
+
+    result = engine.run(sheet=sheet, source=sample_source_file,
+                        column='price', adjust=True, write=False)
+
+    assert sheet.written == []
+    assert result['updates'] == [{'range': 'C4', 'values': [['20']]}]
+
+def test_load_source_cache(sample_source_file):
+    engine = TransferEngine()
+
+    first = engine.load_source(source=sample_source_file)
+    second = engine.load_source(source=sample_source_file)
+
+    assert first is second
+
+def test_transfer_errors(sample_incomplete_sheet, tmp_path):
+    engine = TransferEngine()
+    path = tmp_path / 'invalid.csv'
+    path.write_text('a;b\n1;2\n')
+
+    with pytest.raises(TransferError):
+        engine.transfer(gsheet=sample_incomplete_sheet, source=str(path))
+    with pytest.raises(TransferError):
+        engine.transfer(gsheet=sample_incomplete_sheet,
+                        source=str(tmp_path / 'missing.csv'))
+    with pytest.raises(TransferError):
+        engine.transfer(gsheet=sample_incomplete_sheet.iloc[0:0],
+                        source=str(path))
+
+def test_build_undo(sample_run_log):
+    engine = TransferEngine(run_log=sample_run_log)
+
+    undo = engine.build_undo(run_id=1)
+
+    assert undo['updates'] == [
+        {'range': 'B4:C4', 'values': [['', '']]},
+        {'range': 'B5', 'values': [['Cup']]}
+    ]
+    assert undo['snapshot'] == {(3, 1): 'Shirt', (3, 2): '10', (4, 1): 'Mug'}
+    assert undo['unknown'] == 1
+    assert undo['sheet_id'] == 'abc'
+    assert undo['mode'] == 'undo:1'
+
+def test_build_undo_errors(sample_run_log):
+    with pytest.raises(TransferError):
+        TransferEngine().build_undo(run_id=1)
+    with pytest.raises(TransferError):
+        TransferEngine(run_log=sample_run_log).build_undo(run_id=99)
+
+def test_undo(sample_run_log):
+    engine = TransferEngine(run_log=sample_run_log)
+    resource = FailingResource(current={'B4:C4': [['Shirt', 'edited']],
+                                        'B5': [['Mug']]})
+    sheet = GoogleSheet(creds=None, sheet_id='abc', sheet=resource)
+
+    result = engine.undo(sheet=sheet, run_id=1)
+    changes = get_run_changes(path=sample_run_log, run_id=result['run_id'])
+
+    # C4 was edited after the run and is kept
+    assert resource.updates == [[{'range': 'B4:B5', 'values': [[''],
+                                                               ['Cup']]}]]
+    assert [x['range'] for x in result['conflicts']] == ['C4']
+    assert get_run(path=sample_run_log,
+                   run_id=result['run_id'])['mode'] == 'undo:1'
+    assert changes['new_value'].tolist() == ['', 'Cup']
+
+def test_undo_force(sample_run_log):
+    engine = TransferEngine(run_log=sample_run_log)
+    resource = FailingResource(current={'B4:C4': [['Shirt', 'edited']]})
+    sheet = GoogleSheet(creds=None, sheet_id='abc', sheet=resource)
+
+    result = engine.undo(sheet=sheet, run_id=1, force=True)
+
+    assert resource.updates == [[{'range': 'B4:C4', 'values': [['', '']]},
+                                 {'range': 'B5', 'values': [['Cup']]}]]
+    assert result['conflicts'] == []
+    assert result['stats']['changes'] == 3
+
+def test_undo_other_sheet(sample_run_log):
+    engine = TransferEngine(run_log=sample_run_log)
+    sheet = FakeSheet(frame=pandas.DataFrame())
+    sheet.sheet_id = 'xyz'
+
+    with pytest.raises(TransferError):
+        engine.undo(sheet=sheet, run_id=1)
+    assert sheet.written == []
+
+def test_import_without_google_api():
+    code = ('import sys, transfer_flatfile_format; '
+            'print("googleapiclient" in sys.modules)')
+    output = subprocess.run([sys.executable, '-c', code], check=True,
+                            capture_output=True, text=True).stdout
+
+    assert output.strip() == 'False'
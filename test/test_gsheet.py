@@ -1,16 +1,141 @@
 import pytest
+import pandas
+import numpy as np
+from pandas.testing import assert_frame_equal
 
 from transfer_flatfile_format.packages.google_sheet import (
-    build_column_name
+    remove_conflicts, parse_sheet_values, default_row_selection, GoogleSheet
 )
+from transfer_flatfile_format.packages.sheet_updates import build_update_data
+from transfer_flatfile_format.packages.row_selection import select_rows
 
-def test_build_column_name():
-    expect = ['A', 'D', 'AB', 'BF', 'ZZ']
-    result = []
+def test_build_update_data():
+    frame = pandas.DataFrame(
+        [['1234x', 'a', 'b', 3], ['1235x', 'c', np.nan, 4],
+         ['1236x', 'e', 'f', 6]],
+        columns=['item_sku', 'test', 'test2', 'index'])
+    expect = [
+        {'range': 'B4:C5', 'values': [['a', 'b'], ['c', '']]},
+        {'range': 'B7:C7', 'values': [['e', 'f']]}
+    ]
 
-    sample_input = [0, 3, 27, 57, 701]
+    assert expect == build_update_data(frame=frame, exclude=[])
 
-    for i in sample_input:
-        result.append(build_column_name(column_enum=i))
+def test_build_update_data_column():
+    frame = pandas.DataFrame(
+        [['1234x', 'a', 3, 800], ['1235x', 'b', 4, 800]],
+        columns=['item_sku', 'value', 'index', 'column_index'])
+    expect = [{'range': 'ADU4:ADU5', 'values': [['a'], ['b']]}]
 
-    assert expect == result
+    assert expect == build_update_data(frame=frame, exclude=[])
+
+class FakeSheet:
+    """ Minimal stand-in for the spreadsheets resource of the google API """
+    def __init__(self, current):
+        self.current = current
+        self.requested = []
+        self.updates = []
+
+    def values(self):
+        return self
+
+    def batchGet(self, spreadsheetId, ranges):
+        self.requested += ranges
+        self.result = {'valueRanges': [
+            {'range': r, 'values': self.current[r]} if self.current[r]
+            else {'range': r} for r in ranges
+        ]}
+        return self
+
+    def batchUpdate(self, spreadsheetId, body):
+        self.updates.append(body['data'])
+        self.result = {'totalUpdatedRows': len(body['data'])}
+        return self
+
+    def execute(self):
+        return self.result
+
+def test_remove_conflicts():
+    data = [
+        {'range': 'B4:C5', 'values': [['a', 'b'], ['c', 'd']]},
+        {'range': 'E8', 'values': [['f']]}
+    ]
+    snapshot = {(3, 1): '', (3, 2): '', (4, 1): '', (4, 2): '', (7, 4): ''}
+    sheet = FakeSheet(current={'B4:C5': [[], ['', 'edited']], 'E8': []})
+    expect_data = [
+        {'range': 'B4:C4', 'values': [['a', 'b']]},
+        {'range': 'B5', 'values': [['c']]},
+        {'range': 'E8', 'values': [['f']]}
+    ]
+    expect_conflicts = [
+        {'range': 'C5', 'expected': '', 'found': 'edited', 'new': 'd'}
+    ]
+
+    (result, conflicts) = remove_conflicts(sheet=sheet, sheet_id='abc',
+                                           data=data, snapshot=snapshot)
+
+    assert sheet.requested == ['B4:C5', 'E8']
+    assert expect_data == result
+    assert expect_conflicts == conflicts
+
+def test_remove_conflicts_unchanged():
+    data = [{'range': 'B4', 'values': [['a']]}]
+    sheet = FakeSheet(current={'B4': [['old']]})
+
+    (result, conflicts) = remove_conflicts(sheet=sheet, sheet_id='abc',
+                                           data=data,
+                                           snapshot={(3, 1): 'old'})
+
+    assert result == data
+    assert conflicts == []
+
+def test_parse_sheet_values():
+    values = [
+        ['Template'], [],
+        ['feed_product_type', 'item_sku', 'brand_name', 'item_name'],
+        ['shirt', '1234x', 'brand', 'name', 'overflow'],
+        [],
+        ['', '1235x'],
+        ['', '', 'brand']
+    ]
+    expect = pandas.DataFrame(
+        [['shirt', '1234x', 'brand', 'name', 3], ['', '1235x', '', '', 5]],
+        columns=['feed_product_type', 'item_sku', 'brand_name', 'item_name',
+                 'index'])
+
+    result = parse_sheet_values(values=values)
+
+    assert_frame_equal(expect, result)
+
+def test_default_row_selection():
+    frame = parse_sheet_values(values=[
+        [], [],
+        ['type', 'item_sku', 'brand_name', 'a', 'b', 'item_name'],
+        ['', '1234x', 'brand', '', '', 'name'],
+        ['', '1235x', 'brand'],
+        ['', '1236x', '', '', '', 'name']
+    ])
+
+    selection = default_row_selection(column_names=list(frame.columns[:-1]))
+
+    assert select_rows(frame=frame, selection=selection).tolist() ==\
+        [False, True, True]
+
+def test_google_sheet_reuses_resource():
+    values = [
+        ['Template'], [],
+        ['feed_product_type', 'item_sku', 'brand_name', 'item_name'],
+        ['shirt', '1234x', '', 'Shirt'],
+        ['shirt', '1235x', 'Brand', 'Shirt 2']
+    ]
+    resource = FakeSheet(current={'1:2400': values})
+    sheet = GoogleSheet(creds=None, sheet_id='abc', sheet=resource)
+    data = [{'range': 'C4', 'values': [['Brand']]},
+            {'range': 'C6', 'values': [['Brand']]}]
+
+    frame = sheet.read()
+    conflicts = sheet.write(data=data, chunk_size=1)
+
+    assert frame['item_sku'].tolist() == ['1234x']
+    assert conflicts == []
+    assert resource.updates == [data[:1], data[1:]]
@@ -0,0 +1,83 @@
+import configparser
+import warnings
+import pytest
+import pandas
+
+from transfer_flatfile_format.packages.row_selection import (
+    get_row_selection, select_rows
+)
+
+@pytest.fixture
+def sample_sheet_data():
+    llist = [
+        ['', '1234x', 'brand', 'red', 'name', 0],
+        ['', '1235x', '', 'blue', 'name', 1],
+        ['', '1236x', 'brand', 'green', '', 2],
+        ['', '1237x', '', '', '', 3]
+    ]
+
+    return pandas.DataFrame(llist, columns=['feed_product_type', 'item_sku',
+                                            'brand_name', 'color_name',
+                                            'item_name', 'index'])
+
+def build_selection(text):
+    config = configparser.ConfigParser()
+    config.read_string('[Row_selection]\n' + text)
+    return get_row_selection(config=config)
+
+def test_get_row_selection_missing():
+    assert get_row_selection(config=configparser.ConfigParser()) is None
+
+def test_select_rows_any_empty(sample_sheet_data):
+    selection = build_selection('any_empty=brand_name,item_name\n')
+
+    result = select_rows(frame=sample_sheet_data, selection=selection)
+
+    assert result.tolist() == [False, True, True, True]
+
+def test_select_rows_all_empty(sample_sheet_data):
+    selection = build_selection('all_empty=brand_name,item_name,color_name\n')
+
+    result = select_rows(frame=sample_sheet_data, selection=selection)
+
+    assert result.tolist() == [False, False, False, True]
+
+def test_select_rows_match(sample_sheet_data):
+    selection = build_selection('any_filled=brand_name,item_name\n'
+                                'match_color=color_name:^(red|blue)$\n')
+
+    result = select_rows(frame=sample_sheet_data, selection=selection)
+
+    assert result.tolist() == [True, True, False, False]
+
+def test_select_rows_combine_any(sample_sheet_data, tmp_path):
+    path = tmp_path / 'skus.txt'
+    path.write_text('1237x\n\n1234x\n')
+    selection = build_selection('combine=any\n'
+                                f'sku_list={path}\n'
+                                'not_match=color_name:^(red|blue|green)$\n')
+
+    result = select_rows(frame=sample_sheet_data, selection=selection)
+
+    assert result.tolist() == [True, False, False, True]
+
+def test_get_row_selection_percent():
+    selection = build_selection('match_rate=discount:^\\d+%$\n')
+
+    assert selection['predicates'][0]['pattern'].pattern == r'^\d+%$'
+
+def test_select_rows_unknown_column(sample_sheet_data):
+    selection = build_selection('any_empty=product_name\n')
+
+    result = select_rows(frame=sample_sheet_data, selection=selection)
+
+    assert not result.any()
+
+def test_select_rows_match_no_warning(sample_sheet_data):
+    selection = build_selection('match=color_name:^(red|blue)$\n')
+
+    with warnings.catch_warnings():
+        warnings.simplefilter('error')
+        result = select_rows(frame=sample_sheet_data, selection=selection)
+
+    assert result.tolist() == [True, True, False, False]
@@ -0,0 +1,78 @@
+import pytest
+
+from transfer_flatfile_format.packages.run_log import (
+    record_run, finish_run, get_runs, get_run, get_run_changes,
+    get_sku_history, build_inverse_changes
+)
+
+@pytest.fixture
+def sample_changes():
+    return [
+        {'row': 3, 'column_index': 4, 'sku': '1234x', 'column': 'item_name',
+         'old': '', 'new': 'Shirt'},
+        {'row': 3, 'column_index': 5, 'sku': '1234x', 'column': 'price',
+         'old': None, 'new': '10'},
+        {'row': 4, 'column_index': 4, 'sku': '1235x', 'column': 'item_name',
+         'old': 'Cup', 'new': 'Mug'}
+    ]
+
+def test_record_run(tmp_path, sample_changes):
+    path = str(tmp_path / 'run_log.sqlite')
+
+    first = record_run(path=path, sheet_id='abc', source='a.csv',
+                       mode='transfer', changes=sample_changes)
+    second = record_run(path=path, sheet_id='abc', source='b.csv',
+                        mode='transfer', changes=sample_changes[2:])
+
+    assert second == first + 1
+    assert list(get_runs(path=path)['run_id']) == [second, first]
+    assert get_run(path=path, run_id=first)['changes'] == 3
+    assert get_run(path=path, run_id=99) == {}
+
+    changes = get_run_changes(path=path, run_id=first)
+    assert list(changes['new_value']) == ['Shirt', '10', 'Mug']
+    assert changes['old_value'].isna().tolist() == [False, True, False]
+
+def test_finish_run(tmp_path, sample_changes):
+    path = str(tmp_path / 'run_log.sqlite')
+    run_id = record_run(path=path, sheet_id='abc', source='a.csv',
+                        mode='transfer', changes=sample_changes,
+                        status='started')
+
+    finish_run(path=path, run_id=run_id, skipped={(3, 5)})
+
+    run = get_run(path=path, run_id=run_id)
+    assert run['status'] == 'complete'
+    assert run['changes'] == 2
+    assert list(get_run_changes(path=path, run_id=run_id)['new_value']) == [
+        'Shirt', 'Mug'
+    ]
+
+def test_get_sku_history(tmp_path, sample_changes):
+    path = str(tmp_path / 'run_log.sqlite')
+    first = record_run(path=path, sheet_id='abc', source='a.csv',
+                       mode='transfer', changes=sample_changes)
+    second = record_run(path=path, sheet_id='abc', source='b.csv',
+                        mode='transfer', changes=sample_changes[2:])
+
+    history = get_sku_history(path=path, sku='1235x', days=7)
+
+    assert list(history['run_id']) == [second, first]
+    assert len(get_sku_history(path=path, sku='1234x').index) == 2
+    assert len(get_sku_history(path=path, sku='unknown').index) == 0
+
+def test_build_inverse_changes(tmp_path, sample_changes):
+    path = str(tmp_path / 'run_log.sqlite')
+    run_id = record_run(path=path, sheet_id='abc', source='a.csv',
+                        mode='transfer', changes=sample_changes)
+    expect = [
+        {'row': 3, 'column_index': 4, 'sku': '1234x', 'column': 'item_name',
+         'old': 'Shirt', 'new': ''},
+        {'row': 4, 'column_index': 4, 'sku': '1235x', 'column': 'item_name',
+         'old': 'Mug', 'new': 'Cup'}
+    ]
+
+    (inverse, unknown) = build_inverse_changes(path=path, run_id=run_id)
+
+    assert expect == inverse
+    assert unknown == 1
@@ -0,0 +1,66 @@
+import re
+import pytest
+
+from transfer_flatfile_format.packages.sku_index import (
+    normalize_sku, build_sku_index, lookup_sku, DEFAULT_SUFFIX_PATTERN
+)
+
+@pytest.fixture
+def sample_options():
+    return {'rules': ['case', 'whitespace', 'leading_zeros', 'suffix'],
+            'suffix_pattern': DEFAULT_SUFFIX_PATTERN, 'fuzzy': True,
+            'min_confidence': 0.7}
+
+@pytest.fixture
+def sample_source_skus():
+    return ['ABC-1234', '00789', 'shirt-red-parent', 'MUG-BLUE-XL',
+            'dup-1', 'DUP-1', None]
+
+def test_normalize_sku():
+    expect = ['ABC-1234', '789', 'SHIRT-RED', '0']
+    result = []
+
+    sample_input = [' abc-1234 ', '00789', 'shirt-red-Parent', '000']
+
+    suffix = re.compile(DEFAULT_SUFFIX_PATTERN, re.IGNORECASE)
+    for sku in sample_input:
+        result.append(normalize_sku(
+            sku=sku, rules=['case', 'whitespace', 'leading_zeros', 'suffix'],
+            suffix=suffix))
+
+    assert expect == result
+
+def test_lookup_sku(sample_options, sample_source_skus):
+    index = build_sku_index(skus=sample_source_skus, options=sample_options)
+
+    assert lookup_sku(index=index, skus=['ABC-1234']) == (0, 1.0, 'exact')
+    assert lookup_sku(index=index, skus=['abc-1234 ']) ==\
+        (0, 1.0, 'normalized')
+    assert lookup_sku(index=index, skus=['789']) == (1, 1.0, 'normalized')
+    assert lookup_sku(index=index, skus=['Shirt-Red-child']) ==\
+        (2, 1.0, 'normalized')
+    assert lookup_sku(index=index, skus=['unknown', '00789']) ==\
+        (1, 1.0, 'exact')
+
+def test_lookup_sku_fuzzy(sample_options, sample_source_skus):
+    index = build_sku_index(skus=sample_source_skus, options=sample_options)
+
+    (position, confidence, method) = lookup_sku(index=index,
+                                                skus=['MUG-BLUE-X'])
+
+    assert (position, method) == (3, 'fuzzy')
+    assert 0.7 <= confidence < 1.0
+    assert lookup_sku(index=index, skus=['XYZ-99']) == (-1, 0.0, '')
+
+def test_lookup_sku_ambiguous(sample_options, sample_source_skus):
+    index = build_sku_index(skus=sample_source_skus, options=sample_options)
+
+    assert lookup_sku(index=index, skus=['DUP-1']) == (5, 1.0, 'exact')
+    assert lookup_sku(index=index, skus=['Dup-1']) == (-1, 0.0, '')
+
+def test_lookup_sku_exact_only(sample_source_skus):
+    options = {'rules': [], 'suffix_pattern': '', 'fuzzy': False,
+               'min_confidence': 0.8}
+    index = build_sku_index(skus=sample_source_skus, options=options)
+
+    assert lookup_sku(index=index, skus=['abc-1234']) == (-1, 0.0, '')
@@ -0,0 +1,89 @@
+import pytest
+
+from transfer_flatfile_format.packages.write_plan import (
+    build_write_plan, save_write_plan, load_write_plan, plan_changes
+)
+
+@pytest.fixture
+def sample_update_data():
+    return [
+        {'range': 'B4:C5', 'values': [['a', 'b'], ['c', '']]},
+        {'range': 'B7', 'values': [['e']]},
+        {'range': 'E8:E9', 'values': [['f'], ['g']]}
+    ]
+
+def test_build_write_plan(sample_update_data):
+    plan = build_write_plan(sheet_id='abc', data=sample_update_data,
+                            chunk_size=4)
+
+    assert plan['header']['ranges'] == 3
+    assert plan['header']['cells'] == 7
+    assert plan['header']['api_calls'] == 2
+    assert plan['header']['check_calls'] == 0
+    assert plan['data'] == sample_update_data
+
+def test_build_write_plan_check_calls(sample_update_data):
+    snapshot = {(3, 1): 'x'}
+    plan = build_write_plan(sheet_id='abc', data=sample_update_data * 2,
+                            chunk_size=4, snapshot=snapshot, check_size=2)
+
+    # chunks: [B4:C5], [B7, E8:E9], [B4:C5], [B7, E8:E9]
+    assert plan['header']['api_calls'] == 4
+    assert plan['header']['check_calls'] == 4
+
+def test_build_write_plan_large_range():
+    data = [{'range': 'A4:FD2003', 'values': [['x'] * 160] * 2000}]
+    plan = build_write_plan(sheet_id='abc', data=data, chunk_size=3000,
+                            snapshot={(3, 0): ''}, check_size=100)
+
+    # 18 rows of 160 cells per batchUpdate, each read back with one batchGet
+    assert plan['header']['cells'] == 320000
+    assert plan['header']['api_calls'] == 112
+    assert plan['header']['check_calls'] == 112
+
+@pytest.mark.parametrize('name', ['plan.jsonl', 'plan.jsonl.gz'])
+def test_write_plan_roundtrip(tmp_path, sample_update_data, name):
+    path = str(tmp_path / name)
+    plan = build_write_plan(sheet_id='abc', data=sample_update_data,
+                            chunk_size=3000)
+
+    save_write_plan(plan=plan, path=path)
+
+    assert load_write_plan(path=path) == plan
+
+def test_load_write_plan_incomplete(tmp_path, sample_update_data):
+    path = tmp_path / 'plan.jsonl'
+    plan = build_write_plan(sheet_id='abc', data=sample_update_data,
+                            chunk_size=3000)
+    save_write_plan(plan=plan, path=str(path))
+    lines = path.read_text().splitlines()
+    path.write_text('\n'.join(lines[:-1]) + '\n')
+
+    assert load_write_plan(path=str(path)) == {}
+
+def test_write_plan_snapshot_roundtrip(tmp_path, sample_update_data):
+    path = str(tmp_path / 'plan.jsonl')
+    snapshot = {(3, 1): 'x', (3, 2): '', (4, 1): 'y', (7, 4): 'z'}
+    plan = build_write_plan(sheet_id='abc', data=sample_update_data,
+                            chunk_size=3000, snapshot=snapshot)
+
+    save_write_plan(plan=plan, path=path)
+    result = load_write_plan(path=path)
+
+    assert result['header']['checked']
+    assert result['data'] == sample_update_data
+    assert result['snapshot'] == snapshot
+
+def test_plan_changes(sample_update_data):
+    snapshot = {(3, 1): 'x', (3, 2): 'b', (4, 1): 'y', (7, 4): 'f'}
+    plan = build_write_plan(sheet_id='abc', data=sample_update_data,
+                            chunk_size=3000, snapshot=snapshot)
+
+    changes = plan_changes(plan=plan)
+
+    # unchanged cells (C4, E8) are not part of the changes
+    assert [(x['row'], x['column_index'], x['old'], x['new'])
+            for x in changes] == [
+        (3, 1, 'x', 'a'), (4, 1, 'y', 'c'), (4, 2, None, ''),
+        (6, 1, None, 'e'), (8, 4, None, 'g')
+    ]
@@ -0,0 +1 @@
+from transfer_flatfile_format.engine import TransferEngine, TransferError
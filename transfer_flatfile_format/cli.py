@@ -21,18 +21,19 @@ import os
 import argparse
 import configparser
 import pandas
-import numpy as np
 
+from transfer_flatfile_format.engine import TransferEngine, TransferError
 from transfer_flatfile_format.packages import google_sheet
+from transfer_flatfile_format.packages.google_sheet import DATA_DIR
+from transfer_flatfile_format.packages import write_plan
+from transfer_flatfile_format.packages import run_log
+from transfer_flatfile_format.packages.row_selection import get_row_selection
 
-USER = os.getlogin()
-if sys.platform == 'linux':
-    DATA_DIR = os.path.join('/', 'home', str(f'{USER}'),
-                            '.transfer_flatfile_format_data/')
-elif sys.platform == 'win32':
-    DATA_DIR = os.path.join('C:\\', 'Users', str(f'{USER}'),
-                            '.transfer_flatfile_format_data/')
 CONFIG_PATH = os.path.join(DATA_DIR, 'config.ini')
+PLAN_PATH = os.path.join(DATA_DIR, 'write_plan.jsonl')
+CONFLICT_PATH = os.path.join(DATA_DIR, 'last_conflicts.csv')
+FUZZY_MATCH_PATH = os.path.join(DATA_DIR, 'last_fuzzy_matches.csv')
+RUN_LOG_PATH = os.path.join(DATA_DIR, 'run_log.sqlite')
 
 
 def check_path(path):
@@ -56,200 +57,154 @@ def check_path(path):
     return full_path
 
 
-def get_matchtable_data(config):
-    data = {'activate': False, 'main_sku': '', 'alt_sku': '', 'src': ''}
-
-    if not config:
-        return data
-
-    if 'Match_table' not in config.sections():
-        return data
-
-    if (not config.has_option(section='Match_table', option='main_sku') or\
-            not config.has_option(section='Match_table', option='alt_sku') or\
-            not config.has_option(section='Match_table', option='sku_export') or\
-            not config.has_option(section='Match_table', option='with_matchtable')):
-        print("WARNING: Match table configuration data not complete")
-        return data
-
-    if config['Match_table']['with_matchtable'].lower()[0] == 'y':
-        data['activate'] = True
-    else:
-        return data
+def report_matches(matches):
+    """
+        Print how the SKUs were matched and save the fuzzy matches for a
+        manual review.
 
-    data['main_sku'] = config['Match_table']['main_sku']
-    data['alt_sku'] = config['Match_table']['alt_sku']
-    data['src'] = config['Match_table']['sku_export']
+        Parameter:
+            matches [DataFrame]     -   Result of locate_source_rows
+    """
+    for method, count in matches['method'].replace('', 'none')\
+            .value_counts().items():
+        print(f"\t{method}: {count}")
 
-    return data
+    fuzzy = matches[matches['method'] == 'fuzzy']
+    if len(fuzzy.index) > 0:
+        fuzzy.to_csv(FUZZY_MATCH_PATH, sep=';')
+        print(f"Saved {len(fuzzy.index)} fuzzy matches to {FUZZY_MATCH_PATH}")
 
 
-def get_exclude_options(string):
+def save_conflicts(conflicts):
     """
-        Parse the command line option to check if the columns are valid
-        and separated in the correct format.
+        Store the cells, that were skipped because they were changed on the
+        google sheet during the transfer, for a manual review.
 
         Parameter:
-            string [String]     -   single column or multiple separated columns
-
-        Return:
-            [List]
+            conflicts [List]    -   Conflicts returned by the write
     """
-    if string.find(','):
-        return string.strip(' ').split(',')
-    return [string.strip(' ')]
+    if not conflicts:
+        return
+    pandas.DataFrame(conflicts, columns=['range', 'expected', 'found', 'new'])\
+        .to_csv(CONFLICT_PATH, sep=';', index=False)
+    print(f"Saved the skipped cells to {CONFLICT_PATH}")
 
 
-def exclude_columns(data, columns):
+def log_run(written):
     """
-        Check if the columns from the command line option 'exclude'
-        match the columns read from the google sheet.
+        Tell the user the ID of the run, that was recorded by the engine
+        within the run log.
 
         Parameter:
-            data [DataFrame]    -   Data from the google sheet
-            columns [String]    -   Columns for exclusion from CLI
-
-        Return:
-            [List]              -   List of valid columns to exclude
+            written [Dict]      -   Result of TransferEngine.write_updates
+                                    or TransferEngine.write
     """
-    if not columns:
-        return []
-
-    sub_arguments = get_exclude_options(string=columns)
-
-    for arg in sub_arguments:
-        if arg not in data.columns:
-            print(f"WARNING: No column named [{arg}] in the google sheet")
-            sub_arguments.remove(arg)
+    print(f"Logged {len(written['changes'])} changes as run "
+          f"{written['run_id']}")
 
-    return sub_arguments
 
-
-def create_match_table(sheet, intern_list, config):
+def show_history(args):
     """
-        Create a data-frame of the SKUs found in the google sheet,
-        together with an alternative to improve the chances of finding
-        a match.
+        Print the requested part of the run log.
 
         Parameter:
-            sheet [DataFrame]       -   The google sheet data
-            intern_list [DataFrame] -   A separate list with alternative SKUs
-            config [Dict]           -   match table information from the config
-
-        Return:
-            [DataFrame] - SKU/Alternative SKU
+            args [Namespace]    -   Parsed command line arguments
     """
-    main_sku = config['main_sku']
-    alt_sku = config['alt_sku']
-
-    reduced_intern =\
-        intern_list[[main_sku, alt_sku]].rename(
-            columns={main_sku:'item_sku',
-                     alt_sku:'alt_sku'})
-    reduced_intern = reduced_intern.astype({'item_sku': object})
-    merge = sheet.merge(reduced_intern, how='left')
-    merge['alt_sku'].replace(np.nan, '', inplace=True)
-
-    return merge[['item_sku', 'alt_sku']]
-
-
-def adjust_value(data, config):
+    with pandas.option_context('display.max_rows', None,
+                               'display.max_columns', None,
+                               'display.width', None):
+        if args.runs:
+            print(run_log.get_runs(path=RUN_LOG_PATH).to_string(index=False))
+        if args.show_run:
+            changes = run_log.get_run_changes(path=RUN_LOG_PATH,
+                                              run_id=args.show_run)
+            print(changes.to_string(index=False))
+        if args.history:
+            changes = run_log.get_sku_history(path=RUN_LOG_PATH,
+                                              sku=args.history,
+                                              days=args.days)
+            print(changes.to_string(index=False))
+
+
+def apply_plan(path, force):
     """
-        Use a simple python expression to modify all values from the
-        original flatfile.
+        Write the updates of a plan created with '--dry-run' to the google
+        sheet referenced within the plan.
 
         Parameter:
-            data [DataFrame]    -   GoogleSheet
-            config [ConfigParser object]
+            path [String]       -   Path string from argument parser
+            force [Bool]        -   Overwrite cells changed since the plan was
+                                    created
     """
-    # remove NaN values from the sheet
-    data['value'].fillna(0, inplace=True)
-    data['value'] = data['value'].astype(str)
-    if config.has_option(section='Adjust', option='command'):
-        data['value'] = data['value'].apply(lambda x: eval(
-            config['Adjust']['command'].replace('X', str(x))
-        ))
-        data['value'] = data['value'].astype(str)
-        data['value'] = data['value'].str.replace('^0$', '')
-    else:
-        print("ERROR: Add a 'command' option to the config for '-a'")
+    plan_path = check_path(path=path)
+    if not plan_path:
         sys.exit(1)
 
+    plan = write_plan.load_write_plan(path=plan_path)
+    if not plan:
+        sys.exit(1)
 
-def find_match(sku, header, source, table):
-    """
-        Check if the given SKU or the alternative SKU (from the match table)
-        can be located in the orignal format (SOURCE). Try to fetch the value
-        from the column HEADER if that one is present in the source.
-
-        Parameter:
-            sku [String]        -   given SKU from the google sheet
-            header [String]     -   Name of the column from the google sheet
-            source [DataFrame]  -   original Flatfile format from CLI
-            table  [DataFrame]  -   Table with google sheet SKUs and matching
-                                    alternative SKUs
+    write_plan.print_plan_summary(plan=plan)
+    sheet = google_sheet.GoogleSheet(
+        creds=google_sheet.get_google_credentials(),
+        sheet_id=plan['header']['sheet_id'],
+        chunk_size=plan['header']['chunk_size'])
+    engine = TransferEngine(run_log=RUN_LOG_PATH)
+    print("write")
+    written = engine.write_updates(
+        sheet=sheet, updates=plan['data'],
+        changes=write_plan.plan_changes(plan=plan),
+        snapshot=None if force else plan['snapshot'], source=plan_path,
+        mode='plan')
+    save_conflicts(conflicts=written['conflicts'])
+    log_run(written=written)
 
-        Return:
-            [String/Int]        -   Value from the combination of SKU/HEADER
-                                    OR ''
-    """
-    if header not in source.columns:
-        return ''
 
-    source_match = source[source['item_sku'] == sku]
-    try:
-        table_match = table[table['item_sku'] == sku]
-    except KeyError:
-        table_match = pandas.DataFrame()
-
-    if len(source_match.index) > 0:
-        value = source_match[header]
-    elif len(table_match.index) == 0:
-        return ''
-    elif len(source[source['item_sku'] ==
-                    table_match['alt_sku'].values[0]].index) > 0:
-        value = source[source['item_sku'] ==
-                       table_match['alt_sku'].values[0]][header]
-    else:
-        return ''
-    if len(value.index) == 0:
-        return ''
-    if value.values[0] == 0:
-        return ''
-    return value.values[0]
-
-
-def transfer_from_original(gsheet, source, match_table, exclude):
+def undo_run(run_id, force, dry_run):
     """
-        Fill out columns, that can be located in the google sheet as well as
-        the original flatfile format, within the google sheet with values from
-        the source flatfile.
+        Restore the values from before the run RUN_ID on the google sheet
+        (TransferEngine.undo). Cells changed after the run are kept, unless
+        FORCE is set.
 
         Parameter:
-            gsheet [DataFrame]      -   Google sheet containing the target
-                                        flatfile format
-            source [DataFrame]      -   Source flatfile format from the CLI
-            match_table [DataFrame] -   Frame containing a SKU/Altenative Sku
-                                        mapping
-            exclude[List]           -   List of columns to exclude
-
-        Return:
-            [DataFrame]             -   Google sheet with filled out values
-                                        from the original format
+            run_id [Int]        -   ID of the run from the run log
+            force [Bool]        -   Overwrite cells changed after the run
+            dry_run [String]    -   Save the updates as plan at this location
+                                    instead of writing them
     """
-    for header in gsheet.columns:
-        if header in ['item_sku', 'index']:
-            continue
-        if header in exclude:
-            continue
-        gsheet[header] = gsheet['item_sku'].apply(lambda x: find_match(
-            sku=x, header=header, source=source, table=match_table))
-        # filter remaining '0' values
-        if gsheet[header].dtypes == object:
-            if len(gsheet[gsheet[header].str.contains(r"^0$",
-                                                      na=False)].index) > 0:
-                gsheet[header] = gsheet[header].str.replace(r"^0$", '')
-    return gsheet
+    engine = TransferEngine(run_log=RUN_LOG_PATH)
+    try:
+        undo = engine.build_undo(run_id=run_id)
+    except TransferError as err:
+        print(f"ERROR: {err}")
+        sys.exit(1)
+
+    if undo['unknown']:
+        print(f"WARNING: {undo['unknown']} cells of run {run_id} have no "
+              "previous value and can't be restored")
+    if not undo['updates']:
+        print(f"Nothing to restore for run {run_id}")
+        return
+
+    if dry_run:
+        plan = write_plan.build_write_plan(
+            sheet_id=undo['sheet_id'], data=undo['updates'],
+            chunk_size=google_sheet.WRITE_CHUNK_SIZE,
+            snapshot=undo['snapshot'],
+            check_size=google_sheet.CHECK_CHUNK_SIZE)
+        write_plan.save_write_plan(plan=plan, path=dry_run)
+        write_plan.print_plan_summary(plan=plan)
+        print(f"Saved write plan to {dry_run}")
+        return
+
+    sheet = google_sheet.GoogleSheet(
+        creds=google_sheet.get_google_credentials(),
+        sheet_id=undo['sheet_id'])
+    print(f"undo run {run_id}: {undo['stats']['cells']} cells in "
+          f"{undo['stats']['ranges']} ranges")
+    result = engine.undo(sheet=sheet, run_id=run_id, force=force)
+    save_conflicts(conflicts=result['conflicts'])
+    log_run(written=result)
 
 
 def set_up_argparser():
@@ -257,7 +212,7 @@ def set_up_argparser():
     parser.add_argument(
         '-o',
         '--original',
-        required=True,
+        required=False,
         action='store',
         dest='original',
         help='original flatfile format')
@@ -289,22 +244,95 @@ def set_up_argparser():
         action='store_true',
         dest='adjust',
         help='Only with --column, use a command from config to adjust values')
+    parser.add_argument(
+        '-d',
+        '--dry-run',
+        required=False,
+        action='store',
+        nargs='?',
+        const=PLAN_PATH,
+        dest='dry_run',
+        help='save the planned sheet updates to a file (default: '
+        'write_plan.jsonl at ~/.transfer_flatfile_format) without writing')
+    parser.add_argument(
+        '-p',
+        '--apply-plan',
+        required=False,
+        action='store',
+        dest='apply_plan',
+        help='write the updates from a plan saved with --dry-run')
+    parser.add_argument(
+        '-f',
+        '--force',
+        required=False,
+        action='store_true',
+        dest='force',
+        help='overwrite cells, that were changed on the google sheet during '
+        'the transfer')
+    parser.add_argument(
+        '-u',
+        '--undo',
+        required=False,
+        action='store',
+        type=int,
+        dest='undo',
+        help='restore the values from before the run with the given ID')
+    parser.add_argument(
+        '--runs',
+        required=False,
+        action='store_true',
+        dest='runs',
+        help='list the latest runs from the run log')
+    parser.add_argument(
+        '--show-run',
+        required=False,
+        action='store',
+        type=int,
+        dest='show_run',
+        help='list the changes written by the run with the given ID')
+    parser.add_argument(
+        '--history',
+        required=False,
+        action='store',
+        dest='history',
+        help='list the changes written to the given SKU')
+    parser.add_argument(
+        '--days',
+        required=False,
+        action='store',
+        type=int,
+        dest='days',
+        help='Only with --history, limit the history to the last days')
     args = parser.parse_args()
 
     if args.adjust and not args.column:
         print("ERROR: You can only use --adjust in combination with --column")
         sys.exit(1)
 
+    if args.apply_plan and (args.original or args.dry_run):
+        print("ERROR: --apply-plan can't be combined with --original or "
+              "--dry-run")
+        sys.exit(1)
+
+    if args.undo and (args.original or args.apply_plan):
+        print("ERROR: --undo can't be combined with --original or "
+              "--apply-plan")
+        sys.exit(1)
+
+    if args.days and not args.history:
+        print("ERROR: You can only use --days in combination with --history")
+        sys.exit(1)
+
+    args.query = bool(args.runs or args.show_run or args.history)
+    if not args.original and not args.apply_plan and not args.undo and\
+            not args.query:
+        print("ERROR: the following argument is required: -o/--original")
+        sys.exit(1)
+
     return args
 
 
 def cli():
-    orig_path = ''
-    sheet_id = ''
-    ex = []
-    match_table = pandas.DataFrame()
-    with_matchtable = False
-
     args = set_up_argparser()
 
     if not os.path.exists(DATA_DIR):
@@ -313,13 +341,23 @@ def cli():
     config = configparser.ConfigParser()
     config.read(CONFIG_PATH)
 
-    sheet_id = config['General']['google_sheet_id']
-    matchtable_data = get_matchtable_data(config=config)
+    if args.query:
+        show_history(args=args)
+        return
 
-    if matchtable_data['activate']:
-        with_matchtable = True
+    if args.apply_plan:
+        apply_plan(path=args.apply_plan, force=args.force)
+        return
 
+    if args.undo:
+        undo_run(run_id=args.undo, force=args.force, dry_run=args.dry_run)
+        return
+
+    sheet_id = config['General']['google_sheet_id']
     creds = google_sheet.get_google_credentials()
+    sheet = google_sheet.GoogleSheet(
+        creds=creds, sheet_id=sheet_id,
+        selection=get_row_selection(config=config))
 
     orig_path = check_path(path=args.original)
 
@@ -327,69 +365,38 @@ def cli():
         print("path to required file not valid\n[{0}]".format(orig_path))
         sys.exit(1)
 
-    # We just want to copy values so just take everything as a string
-    orig = pandas.read_csv(orig_path, sep=';', dtype=str)
-    if 'item_sku' not in orig.columns:
-        orig = pandas.read_csv(orig_path, sep=';', dtype=str, header=2)
-        if 'item_sku' not in orig.columns:
-            print("ERROR: invalid flatfile from '--original'")
-            print("\tCould not locate 'item_sku' in row 1 or 3")
-            sys.exit(1)
-
-    if len(orig.index) == 0:
-        print(f"ERROR: Empty file provides by '--original' @ {orig_path}")
-
-
-    print("read")
-    if args.column:
-        gsheet = google_sheet.read_specified_column(creds=creds,
-                                                    sheet_id=sheet_id,
-                                                    target_column=args.column)
-    elif not args.column:
-        gsheet = google_sheet.read_incomplete_data(creds=creds,
-                                                   sheet_id=sheet_id)
-
-    if len(gsheet.index) == 0:
+    engine = TransferEngine(config=config, run_log=RUN_LOG_PATH)
+    print("transfer")
+    try:
+        result = engine.run(sheet=sheet, source=orig_path, column=args.column,
+                            exclude=args.exclude, adjust=args.adjust,
+                            write=False, force=args.force)
+    except TransferError as err:
+        print(f"ERROR: {err}")
         sys.exit(1)
 
-    if args.exclude:
-        ex = exclude_columns(data=gsheet, columns=args.exclude)
-        if not ex:
-            print("ERROR: Option '-e' needs a ',' separated list of strings")
-            sys.exit(1)
-
-    print("match")
-    if with_matchtable:
-        print("Downloading alternative SKUs..")
-        inter = pandas.read_csv(matchtable_data['src'], sep=';')
-        print("finished.")
-        match_table = create_match_table(sheet=gsheet,
-                                         intern_list=inter,
-                                         config=matchtable_data)
-
-    print("transfer")
-    if args.column:
-        gsheet['value'] = gsheet['item_sku'].apply(lambda x: find_match(
-            sku=x, header=args.column, source=orig, table=match_table))
-        if args.adjust and config.has_section('Adjust'):
-            adjust_value(data=gsheet, config=config)
-        elif args.adjust and not config.has_section('Adjust'):
-            print("ERROR: Add a 'Adjust' section and 'command' option for -a")
-            sys.exit(1)
-        gsheet = gsheet[gsheet['value'] != '']
-    elif not args.column:
-        gsheet = transfer_from_original(gsheet=gsheet,
-                                        source=orig,
-                                        match_table=match_table,
-                                        exclude=ex)
+    report_matches(matches=result['matches'])
+    for header, source_header in result['column_map'].items():
+        if header != source_header:
+            print(f"\t{source_header} => {header}")
 
     if args.save:
-        gsheet.to_csv(os.path.join(DATA_DIR, 'last_changes.csv'),
-                      sep=';',
-                      index=False)
+        result['frame'].to_csv(os.path.join(DATA_DIR, 'last_changes.csv'),
+                               sep=';',
+                               index=False)
+
+    if args.dry_run:
+        plan = write_plan.build_write_plan(
+            sheet_id=sheet_id, data=result['updates'],
+            chunk_size=google_sheet.WRITE_CHUNK_SIZE,
+            snapshot=result['snapshot'],
+            check_size=google_sheet.CHECK_CHUNK_SIZE)
+        write_plan.save_write_plan(plan=plan, path=args.dry_run)
+        write_plan.print_plan_summary(plan=plan)
+        print(f"Saved write plan to {args.dry_run}")
+        return
 
     print("write")
-    google_sheet.write_google_sheet(creds=creds,
-                                    sheet_id=sheet_id,
-                                    frame=gsheet,
-                                    exclude=ex)
+    engine.write(sheet=sheet, result=result, force=args.force)
+    save_conflicts(conflicts=result['conflicts'])
+    log_run(written=result)
@@ -0,0 +1,690 @@
+"""
+    transfer_flatfile_format
+    Move data inbetween different flatfile formats to the correct postion.
+    Copyright (C) 2020  Sebastian Fricke, Panasiam
+
+    This program is free software: you can redistribute it and/or modify
+    it under the terms of the GNU Affero General Public License as published
+    by the Free Software Foundation, either version 3 of the License, or
+    (at your option) any later version.
+
+    This program is distributed in the hope that it will be useful,
+    but WITHOUT ANY WARRANTY; without even the implied warranty of
+    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+    GNU Affero General Public License for more details.
+
+    You should have received a copy of the GNU Affero General Public License
+    along with this program.  If not, see <https://www.gnu.org/licenses/>.
+"""
+import os
+import pandas
+import numpy as np
+
+from transfer_flatfile_format.packages.sheet_updates import (
+    build_update_data, build_snapshot, collect_changes, conflict_positions
+)
+from transfer_flatfile_format.packages.column_mapping import (
+    get_column_mapping, resolve_column_map
+)
+from transfer_flatfile_format.packages.sku_index import (
+    get_sku_matching_options, build_sku_index, lookup_sku
+)
+from transfer_flatfile_format.packages.run_log import (
+    record_run, finish_run, get_run, build_inverse_changes
+)
+from transfer_flatfile_format.packages.a1_notation import (
+    build_column_table, merge_cell_updates
+)
+
+
+class TransferError(Exception):
+    """ The transfer can't be performed with the given data or options """
+
+
+def read_source(path):
+    """
+        Read an original flatfile, the header is either located in the first
+        or in the third row (Amazon template).
+
+        Parameter:
+            path [String]       -   Location of the flatfile
+
+        Return:
+            [DataFrame]         -   Every value as string
+
+        Raise:
+            TransferError       -   No 'item_sku' column within the file
+    """
+    # We just want to copy values so just take everything as a string
+    source = pandas.read_csv(path, sep=';', dtype=str)
+    if 'item_sku' not in source.columns:
+        try:
+            source = pandas.read_csv(path, sep=';', dtype=str, header=2)
+        except pandas.errors.ParserError:
+            source = pandas.DataFrame()
+        if 'item_sku' not in source.columns:
+            raise TransferError("invalid flatfile from '--original'\n"
+                                "\tCould not locate 'item_sku' in row 1 or 3")
+
+    if len(source.index) == 0:
+        print(f"ERROR: Empty file provides by '--original' @ {path}")
+    return source
+
+
+def get_matchtable_data(config):
+    data = {'activate': False, 'main_sku': '', 'alt_sku': '', 'src': ''}
+
+    if not config:
+        return data
+
+    if 'Match_table' not in config.sections():
+        return data
+
+    if (not config.has_option(section='Match_table', option='main_sku') or\
+            not config.has_option(section='Match_table', option='alt_sku') or\
+            not config.has_option(section='Match_table', option='sku_export') or\
+            not config.has_option(section='Match_table', option='with_matchtable')):
+        print("WARNING: Match table configuration data not complete")
+        return data
+
+    if config['Match_table']['with_matchtable'].lower()[0] == 'y':
+        data['activate'] = True
+    else:
+        return data
+
+    data['main_sku'] = config['Match_table']['main_sku']
+    data['alt_sku'] = config['Match_table']['alt_sku']
+    data['src'] = config['Match_table']['sku_export']
+
+    return data
+
+
+def get_exclude_options(string):
+    """
+        Parse the command line option to check if the columns are valid
+        and separated in the correct format.
+
+        Parameter:
+            string [String]     -   single column or multiple separated columns
+
+        Return:
+            [List]
+    """
+    if string.find(','):
+        return string.strip(' ').split(',')
+    return [string.strip(' ')]
+
+
+def exclude_columns(data, columns):
+    """
+        Check if the columns from the command line option 'exclude'
+        match the columns read from the google sheet.
+
+        Parameter:
+            data [DataFrame]    -   Data from the google sheet
+            columns [String/List] - Columns for exclusion from CLI
+
+        Return:
+            [List]              -   List of valid columns to exclude
+    """
+    if not columns:
+        return []
+
+    if isinstance(columns, str):
+        columns = get_exclude_options(string=columns)
+
+    sub_arguments = []
+    for arg in columns:
+        if arg not in data.columns:
+            print(f"WARNING: No column named [{arg}] in the google sheet")
+            continue
+        sub_arguments.append(arg)
+
+    return sub_arguments
+
+
+def create_match_table(sheet, intern_list, config):
+    """
+        Create a data-frame of the SKUs found in the google sheet,
+        together with an alternative to improve the chances of finding
+        a match.
+
+        Parameter:
+            sheet [DataFrame]       -   The google sheet data
+            intern_list [DataFrame] -   A separate list with alternative SKUs
+            config [Dict]           -   match table information from the config
+
+        Return:
+            [DataFrame] - SKU/Alternative SKU
+    """
+    main_sku = config['main_sku']
+    alt_sku = config['alt_sku']
+
+    reduced_intern =\
+        intern_list[[main_sku, alt_sku]].rename(
+            columns={main_sku:'item_sku',
+                     alt_sku:'alt_sku'})
+    reduced_intern = reduced_intern.astype({'item_sku': object})
+    merge = sheet.merge(reduced_intern, how='left')
+    merge['alt_sku'] = merge['alt_sku'].replace(np.nan, '')
+
+    return merge[['item_sku', 'alt_sku']]
+
+
+def adjust_value(data, config):
+    """
+        Use a simple python expression to modify all values from the
+        original flatfile.
+
+        Parameter:
+            data [DataFrame]    -   GoogleSheet
+            config [ConfigParser object]
+
+        Raise:
+            TransferError       -   No command within the config
+    """
+    if not config or not config.has_option(section='Adjust', option='command'):
+        raise TransferError(
+            "Add a 'Adjust' section and 'command' option for -a")
+
+    # remove NaN values from the sheet
+    data['value'] = data['value'].fillna('').astype(str)
+    filled = data['value'] != ''
+    data.loc[filled, 'value'] = data.loc[filled, 'value'].apply(
+        lambda x: str(eval(config['Adjust']['command'].replace('X', x))))
+    data['value'] = data['value'].str.replace('^0$', '', regex=True)
+
+
+def locate_source_rows(gsheet, source, match_table, index):
+    """
+        Find the row of the source flatfile for every SKU of the google sheet,
+        with the help of the alternative SKUs from the match table.
+
+        Parameter:
+            gsheet [DataFrame]      -   Google sheet containing the target
+                                        flatfile format
+            source [DataFrame]      -   Source flatfile format from the CLI
+            match_table [DataFrame] -   Frame containing a SKU/Altenative Sku
+                                        mapping
+            index [Dict]            -   SKU index of the source
+                                        (build_sku_index)
+
+        Return:
+            [DataFrame]             -   'position' (-1 without match),
+                                        'source_sku', 'confidence', 'method'
+                                        for each row of the google sheet
+    """
+    alternatives = {}
+    if 'alt_sku' in match_table.columns:
+        alternatives = dict(zip(match_table['item_sku'],
+                                match_table['alt_sku']))
+
+    rows = []
+    for sku in gsheet['item_sku']:
+        (position, confidence, method) = lookup_sku(
+            index=index, skus=[sku, alternatives.get(sku, '')])
+        source_sku = source['item_sku'].iat[position] if position >= 0 else ''
+        rows.append([position, source_sku, confidence, method])
+
+    return pandas.DataFrame(
+        rows, columns=['position', 'source_sku', 'confidence', 'method'],
+        index=gsheet.index)
+
+
+def fetch_source_column(source, header, positions):
+    """
+        Pull the values of the column HEADER from the source rows at
+        POSITIONS in a single step.
+
+        Parameter:
+            source [DataFrame]      -   Source flatfile format from the CLI
+            header [String]         -   Name of the column
+            positions [Array]       -   Row positions within the source,
+                                        -1 for rows without a match
+
+        Return:
+            [Array]                 -   Values, '' for missing, empty and
+                                        '0' values
+    """
+    values = np.full(len(positions), '', dtype=object)
+    if header not in source.columns:
+        return values
+
+    found = positions >= 0
+    values[found] = source[header].to_numpy(dtype=object)[positions[found]]
+    values[pandas.isna(values)] = ''
+    values[values == '0'] = ''
+    return values
+
+
+def transfer_from_original(gsheet, source, match_table, exclude,
+                           matches=None, column_map=None):
+    """
+        Fill out columns, that can be located in the google sheet as well as
+        the original flatfile format, within the google sheet with values from
+        the source flatfile.
+
+        Parameter:
+            gsheet [DataFrame]      -   Google sheet containing the target
+                                        flatfile format
+            source [DataFrame]      -   Source flatfile format from the CLI
+            match_table [DataFrame] -   Frame containing a SKU/Altenative Sku
+                                        mapping
+            exclude[List]           -   List of columns to exclude
+            matches [DataFrame]     -   Source rows for the google sheet rows
+                                        (locate_source_rows), exact matches
+                                        only when not given
+            column_map [Dict]       -   google sheet header => source header
+                                        (resolve_column_map), identical
+                                        headers only when not given
+
+        Return:
+            [DataFrame]             -   Google sheet with filled out values
+                                        from the original format
+    """
+    if matches is None:
+        index = build_sku_index(skus=source['item_sku'],
+                                options=get_sku_matching_options(config=None))
+        matches = locate_source_rows(gsheet=gsheet, source=source,
+                                     match_table=match_table, index=index)
+    if column_map is None:
+        column_map = resolve_column_map(
+            sheet_columns=gsheet.columns, source_columns=source.columns,
+            mapping={'aliases': {}, 'patterns': []})
+    positions = matches['position'].to_numpy()
+
+    for header in gsheet.columns:
+        if header in ['item_sku', 'index']:
+            continue
+        if header in exclude:
+            continue
+        gsheet[header] = fetch_source_column(
+            source=source, header=column_map.get(header, ''),
+            positions=positions)
+    return gsheet
+
+
+class TransferEngine:
+    """
+        Transfer values from original flatfiles into google sheet data,
+        independent of the command line and of the google API.
+
+        Everything derived from the config, the read source files with their
+        SKU index, the alternative SKU export and the resolved column
+        mappings are kept between calls, so that a long living process only
+        pays for them once. Call clear_cache() to drop them.
+
+        With a RUN_LOG every write is recorded as a run, which can be
+        inspected and reverted later.
+
+        Parameter:
+            config [ConfigParser object]    -   optional configuration
+                                                (Match_table, Sku_matching,
+                                                 Column_mapping, Adjust)
+            run_log [String]                -   Location of the run log
+                                                (SQLite file)
+    """
+    def __init__(self, config=None, run_log=None):
+        self.config = config
+        self.run_log = run_log
+        self.matchtable_data = get_matchtable_data(config=config)
+        self.sku_options = get_sku_matching_options(config=config)
+        self.column_mapping = get_column_mapping(config=config)
+        self.clear_cache()
+
+    def clear_cache(self):
+        """ Forget the cached source files, indexes and column maps """
+        self._sources = {}
+        self._intern_list = None
+        self._column_maps = {}
+
+    def load_source(self, source):
+        """
+            Get the source flatfile together with its SKU index, files are
+            read again only after they were modified.
+
+            Parameter:
+                source [String/DataFrame]   -   Path or the flatfile itself
+
+            Return:
+                [Tuple]                     -   (DataFrame, SKU index)
+        """
+        if isinstance(source, pandas.DataFrame):
+            if 'item_sku' not in source.columns:
+                raise TransferError("The source requires an 'item_sku' column")
+            return (source, build_sku_index(skus=source['item_sku'],
+                                            options=self.sku_options))
+
+        if not os.path.exists(source):
+            raise TransferError(f"path to required file not valid\n[{source}]")
+        status = os.stat(source)
+        key = (os.path.abspath(source), status.st_mtime, status.st_size)
+        if key not in self._sources:
+            # drop outdated versions of the same file
+            self._sources = {k: v for k, v in self._sources.items()
+                             if k[0] != key[0]}
+            frame = read_source(path=source)
+            self._sources[key] = (frame, build_sku_index(
+                skus=frame['item_sku'], options=self.sku_options))
+        return self._sources[key]
+
+    def get_match_table(self, gsheet):
+        """
+            Create the match table for the SKUs of GSHEET, when the
+            alternative SKUs are activated within the config.
+
+            Parameter:
+                gsheet [DataFrame]  -   Data from the google sheet
+
+            Return:
+                [DataFrame]
+        """
+        if not self.matchtable_data['activate']:
+            return pandas.DataFrame()
+        if self._intern_list is None:
+            print("Downloading alternative SKUs..")
+            self._intern_list = pandas.read_csv(self.matchtable_data['src'],
+                                                sep=';')
+            print("finished.")
+        return create_match_table(sheet=gsheet, intern_list=self._intern_list,
+                                  config=self.matchtable_data)
+
+    def get_column_map(self, sheet_columns, source_columns):
+        """
+            Resolve the google sheet header => source header map once for
+            every combination of headers.
+
+            Parameter:
+                sheet_columns [List]    -   Headers of the google sheet
+                source_columns [List]   -   Headers of the source flatfile
+
+            Return:
+                [Dict]
+        """
+        key = (tuple(sheet_columns), tuple(source_columns))
+        if key not in self._column_maps:
+            self._column_maps[key] = resolve_column_map(
+                sheet_columns=sheet_columns, source_columns=source_columns,
+                mapping=self.column_mapping)
+        return self._column_maps[key]
+
+    def transfer(self, gsheet, source, column=None, exclude=None,
+                 adjust=False):
+        """
+            Fill the google sheet data with the values from the source.
+
+            Parameter:
+                gsheet [DataFrame]          -   Data read from the google sheet
+                                                (read_incomplete_data or
+                                                 read_specified_column)
+                source [String/DataFrame]   -   Original flatfile or its path
+                column [String]             -   Only transfer this column
+                exclude [List/String]       -   Columns not to overwrite
+                adjust [Bool]               -   Modify the values of COLUMN
+                                                with the 'Adjust' command
+
+            Return:
+                [Dict]  -   'frame': transferred data,
+                            'updates': ranges & values for the google sheet,
+                            'snapshot': previous values of the updated cells,
+                            'changes': changed cells with SKU, column name,
+                                       old & new value,
+                            'matches': source row for every google sheet row,
+                            'column_map': sheet header => source header,
+                            'exclude': valid excluded columns,
+                            'stats': amount of rows, matches, ranges & cells,
+                            'source' & 'mode': description for the run log
+
+            Raise:
+                TransferError
+        """
+        if adjust and not column:
+            raise TransferError(
+                "You can only use --adjust in combination with --column")
+        if len(gsheet.index) == 0:
+            raise TransferError("No rows to transfer from the google sheet")
+
+        source_name = source if isinstance(source, str) else ''
+        (source, index) = self.load_source(source=source)
+
+        ex = exclude_columns(data=gsheet, columns=exclude)
+        if exclude and not ex:
+            raise TransferError(
+                "Option '-e' needs a ',' separated list of strings")
+
+        previous = build_snapshot(frame=gsheet, exclude=ex)
+
+        match_table = self.get_match_table(gsheet=gsheet)
+        matches = locate_source_rows(gsheet=gsheet, source=source,
+                                     match_table=match_table, index=index)
+
+        if column:
+            sheet_columns = [column]
+        else:
+            sheet_columns = [x for x in gsheet.columns
+                             if x not in ['item_sku', 'index']]
+        column_map = self.get_column_map(sheet_columns=sheet_columns,
+                                         source_columns=list(source.columns))
+
+        gsheet = gsheet.copy()
+        if column:
+            gsheet['value'] = fetch_source_column(
+                source=source, header=column_map.get(column, ''),
+                positions=matches['position'].to_numpy())
+            if adjust:
+                adjust_value(data=gsheet, config=self.config)
+            gsheet = gsheet[gsheet['value'] != '']
+        else:
+            gsheet = transfer_from_original(gsheet=gsheet,
+                                            source=source,
+                                            match_table=match_table,
+                                            exclude=ex,
+                                            matches=matches,
+                                            column_map=column_map)
+
+        updates = build_update_data(frame=gsheet, exclude=ex)
+        changes = collect_changes(frame=gsheet, exclude=ex,
+                                  previous=previous, column=column)
+        stats = {
+            'rows': len(matches.index),
+            'matched': int((matches['position'] >= 0).sum()),
+            'methods': matches['method'][matches['method'] != '']
+            .value_counts().to_dict(),
+            'ranges': len(updates),
+            'cells': sum(len(row) for item in updates
+                         for row in item['values']),
+            'changes': len(changes)
+        }
+
+        return {
+            'frame': gsheet, 'updates': updates, 'snapshot': previous,
+            'changes': changes, 'matches': matches,
+            'column_map': column_map, 'exclude': ex, 'stats': stats,
+            'source': source_name,
+            'mode': f'column:{column}' if column else 'transfer'
+        }
+
+    def write_updates(self, sheet, updates, changes, snapshot=None,
+                      source='', mode='transfer'):
+        """
+            Write prepared range UPDATES to the SHEET and record the written
+            CHANGES within the run log. Cells changed on the sheet since
+            SNAPSHOT was taken are skipped.
+
+            The run is recorded before the first request, as the sheet is
+            written in chunks and a failing chunk leaves the previous ones on
+            the sheet. When the write fails, the run keeps every change and
+            is marked as 'failed'; an undo skips the unsent cells, because
+            they don't contain the new value.
+
+            Parameter:
+                sheet [Object]              -   Sheet access with a
+                                                write(data, snapshot) method
+                updates [List]              -   Dictionaries with 'range' &
+                                                'values'
+                changes [List]              -   Changed cells
+                                                (collect_changes)
+                snapshot [Dict]             -   (row index, column index) =>
+                                                value, None to overwrite
+                source [String]             -   Original flatfile or plan
+                mode [String]               -   Kind of run
+
+            Return:
+                [Dict]                      -   'changes': written changes,
+                                                'conflicts': skipped cells,
+                                                'run_id': ID within the run
+                                                log or None
+        """
+        run_id = None
+        if self.run_log:
+            run_id = record_run(path=self.run_log,
+                                sheet_id=getattr(sheet, 'sheet_id', ''),
+                                source=source, mode=mode, changes=changes,
+                                status='started')
+        try:
+            conflicts = sheet.write(data=updates, snapshot=snapshot)
+        except Exception:
+            if run_id is not None:
+                finish_run(path=self.run_log, run_id=run_id, skipped=set(),
+                           status='failed')
+            raise
+
+        skipped = conflict_positions(conflicts=conflicts)
+        changes = [x for x in changes
+                   if (x['row'], x['column_index']) not in skipped]
+        if run_id is not None:
+            finish_run(path=self.run_log, run_id=run_id, skipped=skipped)
+        return {'changes': changes, 'conflicts': conflicts, 'run_id': run_id}
+
+    def write(self, sheet, result, force=False):
+        """
+            Write the updates of a transfer RESULT to the SHEET, cells changed
+            on the sheet since it was read are skipped unless FORCE is set.
+            The skipped cells are removed from the changes of RESULT and
+            stored as 'conflicts', the ID of the logged run as 'run_id'.
+
+            Parameter:
+                sheet [Object]              -   Sheet access with a
+                                                write(data, snapshot) method
+                result [Dict]               -   result of transfer
+                force [Bool]                -   Overwrite cells changed on
+                                                the sheet in the meantime
+
+            Return:
+                [Dict]                      -   RESULT
+        """
+        written = self.write_updates(
+            sheet=sheet, updates=result['updates'], changes=result['changes'],
+            snapshot=None if force else result['snapshot'],
+            source=result['source'], mode=result['mode'])
+        result.update(written)
+        result['stats']['changes'] = len(result['changes'])
+        return result
+
+    def run(self, sheet, source, column=None, exclude=None, adjust=False,
+            write=True, force=False):
+        """
+            Read the google sheet, transfer the values from the source and
+            write them back.
+
+            Parameter:
+                sheet [Object]              -   Sheet access with a
+                                                read(column) and a
+                                                write(data, snapshot) method
+                                                (google_sheet.GoogleSheet)
+                source [String/DataFrame]   -   Original flatfile or its path
+                column [String]             -   Only transfer this column
+                exclude [List/String]       -   Columns not to overwrite
+                adjust [Bool]               -   Modify the values of COLUMN
+                write [Bool]                -   Write the updates to SHEET
+                force [Bool]                -   Overwrite cells changed on
+                                                the sheet in the meantime
+
+            Return:
+                [Dict]                      -   result of transfer with the
+                                                skipped cells as 'conflicts'
+                                                and the 'run_id'
+
+            Raise:
+                TransferError
+        """
+        gsheet = sheet.read(column=column)
+        result = self.transfer(gsheet=gsheet, source=source, column=column,
+                               exclude=exclude, adjust=adjust)
+        result['conflicts'] = []
+        result['run_id'] = None
+        if write:
+            self.write(sheet=sheet, result=result, force=force)
+        return result
+
+    def build_undo(self, run_id):
+        """
+            Prepare the updates restoring the values from before the run
+            RUN_ID of the run log, in the same form as a transfer result.
+            The values written by the run are used as snapshot, so that
+            cells changed after the run are detected as conflicts.
+
+            Parameter:
+                run_id [Int]                -   ID of the run
+
+            Return:
+                [Dict]  -   'updates', 'snapshot', 'changes', 'source',
+                            'mode' & 'stats' like transfer, 'sheet_id' of
+                            the run and the amount of cells without a
+                            previous value as 'unknown'
+
+            Raise:
+                TransferError
+        """
+        if not self.run_log:
+            raise TransferError("An undo requires a run log")
+        run = get_run(path=self.run_log, run_id=run_id)
+        if not run:
+            raise TransferError(f"No run with the ID {run_id} in the run log")
+
+        (inverse, unknown) = build_inverse_changes(path=self.run_log,
+                                                   run_id=run_id)
+        cells = {(x['row'], x['column_index']): x['new'] for x in inverse}
+        # the values written by the run are expected to be still in place
+        snapshot = {(x['row'], x['column_index']): x['old'] for x in inverse}
+        width = max(col for _, col in cells) + 1 if cells else 0
+        updates = merge_cell_updates(cells=cells,
+                                     column_table=build_column_table(width))
+        stats = {'ranges': len(updates), 'cells': len(cells),
+                 'changes': len(inverse)}
+        return {
+            'updates': updates, 'snapshot': snapshot, 'changes': inverse,
+            'source': run['source'], 'mode': f'undo:{run_id}',
+            'sheet_id': run['sheet_id'], 'unknown': unknown, 'stats': stats,
+            'conflicts': [], 'run_id': None
+        }
+
+    def undo(self, sheet, run_id, force=False):
+        """
+            Restore the values from before the run RUN_ID on the SHEET, with
+            the same chunked write as a transfer. Cells changed after the
+            run are kept unless FORCE is set. The undo is logged as a run.
+
+            Parameter:
+                sheet [Object]              -   Sheet access with a
+                                                write(data, snapshot) method
+                run_id [Int]                -   ID of the run
+                force [Bool]                -   Overwrite cells changed
+                                                after the run
+
+            Return:
+                [Dict]                      -   result of build_undo with
+                                                the skipped cells as
+                                                'conflicts' and the 'run_id'
+
+            Raise:
+                TransferError
+        """
+        result = self.build_undo(run_id=run_id)
+        sheet_id = getattr(sheet, 'sheet_id', result['sheet_id'])
+        if sheet_id != result['sheet_id']:
+            raise TransferError(f"Run {run_id} was written to the sheet "
+                                f"{result['sheet_id']}, not to {sheet_id}")
+        if not result['updates']:
+            return result
+        return self.write(sheet=sheet, result=result, force=force)
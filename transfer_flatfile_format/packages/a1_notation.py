@@ -0,0 +1,398 @@
+"""
+    transfer_flatfile_format
+    Move data inbetween different flatfile formats to the correct postion.
+    Copyright (C) 2020  Sebastian Fricke, Panasiam
+
+    This program is free software: you can redistribute it and/or modify
+    it under the terms of the GNU Affero General Public License as published
+    by the Free Software Foundation, either version 3 of the License, or
+    (at your option) any later version.
+
+    This program is distributed in the hope that it will be useful,
+    but WITHOUT ANY WARRANTY; without even the implied warranty of
+    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+    GNU Affero General Public License for more details.
+
+    You should have received a copy of the GNU Affero General Public License
+    along with this program.  If not, see <https://www.gnu.org/licenses/>.
+"""
+
+import re
+
+LEN_ALPHABET = 26
+
+A1_PATTERN = re.compile(
+    r"^(?:(?P<sheet>'(?:[^']|'')+'|[^'!]+)!)?"
+    r"(?P<start_col>[A-Za-z]*)(?P<start_row>\d*)"
+    r"(?::(?P<end_col>[A-Za-z]*)(?P<end_row>\d*))?$")
+
+
+def column_letter(column_enum):
+    """
+        Convert a 0-indexed column index number into the column letters
+        used by the A1 notation, without any limit on the width.
+        example: 0 => 'A', 27 => 'AB', 702 => 'AAA'
+
+        Parameter:
+            column_enum [Int]   -   index number of the column
+
+        Return:
+            [String]
+    """
+    if column_enum < 0:
+        raise ValueError(f"Invalid column index {column_enum}")
+    letters = ''
+    column_enum += 1
+    while column_enum > 0:
+        column_enum, remainder = divmod(column_enum - 1, LEN_ALPHABET)
+        letters = chr(ord('A') + remainder) + letters
+    return letters
+
+
+def column_number(letters):
+    """
+        Convert column letters from the A1 notation back into a 0-indexed
+        column index number.
+        example: 'A' => 0, 'AB' => 27, 'AAA' => 702
+
+        Parameter:
+            letters [String]    -   column letters (case insensitive)
+
+        Return:
+            [Int]
+    """
+    if not letters or not letters.isalpha():
+        raise ValueError(f"Invalid column letters '{letters}'")
+    number = 0
+    for letter in letters.upper():
+        number = number * LEN_ALPHABET + (ord(letter) - ord('A') + 1)
+    return number - 1
+
+
+def build_column_table(width):
+    """
+        Precompute the column letters for every column of a sheet with
+        WIDTH columns, so that they don't have to be recalculated per cell.
+
+        Parameter:
+            width [Int]         -   Amount of columns
+
+        Return:
+            [List]              -   Column letters, position == column index
+    """
+    return [column_letter(i) for i in range(width)]
+
+
+def quote_sheet_name(sheet):
+    """
+        Wrap a sheet name into single quotes, when it contains characters
+        that are not allowed in an unquoted A1 sheet reference.
+
+        Parameter:
+            sheet [String]      -   Name of the sheet
+
+        Return:
+            [String]
+    """
+    if re.match(r'^[A-Za-z_][A-Za-z0-9_]*$', sheet):
+        return sheet
+    return "'" + sheet.replace("'", "''") + "'"
+
+
+def build_range(start_col, start_row=None, end_col=None, end_row=None,
+                sheet='', column_table=None):
+    """
+        Build an A1 notation range from 0-indexed column indices and
+        1-indexed row numbers (as displayed in the sheet).
+
+        Parameter:
+            start_col [Int]         -   Index of the first column
+            start_row [Int]         -   Number of the first row, None for
+                                        a whole column
+            end_col [Int]           -   Index of the last column, None for
+                                        a single cell
+            end_row [Int]           -   Number of the last row
+            sheet [String]          -   Optional sheet name for the range
+            column_table [List]     -   Precomputed column letters
+
+        Return:
+            [String]                -   Example: 'A1', 'A1:E5', 'Sheet1!B:B'
+    """
+    def letter(index):
+        if column_table is not None and index < len(column_table):
+            return column_table[index]
+        return column_letter(index)
+
+    start_row = '' if start_row is None else str(start_row)
+    name = letter(start_col) + start_row
+    if end_col is not None or end_row is not None:
+        end_col = start_col if end_col is None else end_col
+        end_row = '' if end_row is None else str(end_row)
+        end = letter(end_col) + end_row
+        if end != name or not start_row:
+            name += ':' + end
+    if sheet:
+        name = quote_sheet_name(sheet) + '!' + name
+    return name
+
+
+def build_row_range(start_row, end_row, sheet=''):
+    """
+        Build an A1 notation range covering whole rows, with every column
+        of the sheet, independent of its width.
+
+        Parameter:
+            start_row [Int]         -   Number of the first row
+            end_row [Int]           -   Number of the last row
+            sheet [String]          -   Optional sheet name for the range
+
+        Return:
+            [String]                -   Example: '1:2400', 'Sheet1!3:3'
+    """
+    name = f'{start_row}:{end_row}'
+    if sheet:
+        name = quote_sheet_name(sheet) + '!' + name
+    return name
+
+
+def parse_range(notation):
+    """
+        Split an A1 notation range into its components.
+        example: "'My Sheet'!B3:D10" =>
+            {'sheet': 'My Sheet', 'start_col': 1, 'start_row': 3,
+             'end_col': 3, 'end_row': 10}
+
+        Missing parts (whole rows/columns, single cells) are set to None.
+
+        Parameter:
+            notation [String]   -   A1 notation range
+
+        Return:
+            [Dict]
+    """
+    match = A1_PATTERN.match(notation.strip())
+    if not match or not (match['start_col'] or match['start_row']):
+        raise ValueError(f"Invalid A1 notation '{notation}'")
+
+    sheet = match['sheet'] or ''
+    if sheet.startswith("'"):
+        sheet = sheet[1:-1].replace("''", "'")
+
+    def to_col(letters):
+        return column_number(letters) if letters else None
+
+    def to_row(digits):
+        return int(digits) if digits else None
+
+    result = {
+        'sheet': sheet,
+        'start_col': to_col(match['start_col']),
+        'start_row': to_row(match['start_row']),
+        'end_col': to_col(match['start_col']),
+        'end_row': to_row(match['start_row'])
+    }
+    if match['end_col'] is not None:
+        result['end_col'] = to_col(match['end_col'])
+        result['end_row'] = to_row(match['end_row'])
+    return result
+
+
+def merge_cell_updates(cells, column_table=None, sheet=''):
+    """
+        Combine single cell updates into rectangular ranges, in order to
+        reduce the amount of entries within a batch update.
+
+        Cells are first joined to horizontal runs within a row, afterwards
+        runs covering the same columns on consecutive rows are stacked. Only
+        cells contained in CELLS are covered by the resulting ranges.
+
+        Parameter:
+            cells [Dict]            -   (row index, column index) => value
+                                        both 0-indexed
+            column_table [List]     -   Precomputed column letters
+            sheet [String]          -   Optional sheet name for the ranges
+
+        Return:
+            [List]                  -   Dictionaries with 'range' & 'values'
+                                        (batchUpdate format)
+    """
+    runs = {}
+    for row, col in sorted(cells.keys()):
+        row_runs = runs.setdefault(row, [])
+        if row_runs and row_runs[-1][1] == col - 1:
+            row_runs[-1][1] = col
+        else:
+            row_runs.append([col, col])
+
+    # (first column, last column) => [top row, bottom row]
+    open_blocks = {}
+    blocks = []
+    for row in sorted(runs.keys()):
+        current = {}
+        for start, end in runs[row]:
+            block = open_blocks.get((start, end))
+            if block and block[1] == row - 1:
+                block[1] = row
+            else:
+                block = [row, row]
+                blocks.append((start, end, block))
+            current[(start, end)] = block
+        open_blocks = current
+
+    data = []
+    for start, end, (top, bottom) in blocks:
+        values = [
+            [cells[(row, col)] for col in range(start, end + 1)]
+            for row in range(top, bottom + 1)
+        ]
+        data.append({
+            'range': build_range(start_col=start, start_row=top + 1,
+                                 end_col=end, end_row=bottom + 1,
+                                 sheet=sheet, column_table=column_table),
+            'values': values
+        })
+    return data
+
+
+def split_cell_updates(data):
+    """
+        Reverse merge_cell_updates, split ranges with their values into
+        single cells. Cells missing in a shortened value list (the google
+        API omits trailing empty values) are set to an empty string.
+
+        Parameter:
+            data [List]             -   Dictionaries with 'range' & 'values'
+
+        Return:
+            [Dict]                  -   (row index, column index) => value
+                                        both 0-indexed
+    """
+    cells = {}
+    for item in data:
+        bounds = parse_range(item['range'])
+        if bounds['start_row'] is None or bounds['start_col'] is None:
+            raise ValueError(f"Unbounded range '{item['range']}'")
+        values = item.get('values', [])
+        for i, row in enumerate(range(bounds['start_row'],
+                                      bounds['end_row'] + 1)):
+            row_values = values[i] if i < len(values) else []
+            for j, col in enumerate(range(bounds['start_col'],
+                                          bounds['end_col'] + 1)):
+                value = row_values[j] if j < len(row_values) else ''
+                cells[(row - 1, col)] = value
+    return cells
+
+
+def count_cells(item):
+    """
+        Count the values of a single range update.
+
+        Parameter:
+            item [Dict]             -   Dictionary with 'range' & 'values'
+
+        Return:
+            [Int]
+    """
+    return sum(len(row) for row in item.get('values', []))
+
+
+def split_update_rows(item, rows):
+    """
+        Split a bounded range update after ROWS rows.
+
+        Parameter:
+            item [Dict]             -   Dictionary with 'range' & 'values'
+            rows [Int]              -   Amount of rows for the first part
+
+        Return:
+            [Tuple]                 -   (first part, rest or None)
+    """
+    bounds = parse_range(item['range'])
+    if bounds['start_row'] + rows > bounds['end_row']:
+        return (item, None)
+
+    def part(first, last, values):
+        return {
+            'range': build_range(start_col=bounds['start_col'],
+                                 start_row=first,
+                                 end_col=bounds['end_col'], end_row=last,
+                                 sheet=bounds['sheet']),
+            'values': values
+        }
+
+    split = bounds['start_row'] + rows
+    return (part(bounds['start_row'], split - 1, item['values'][:rows]),
+            part(split, bounds['end_row'], item['values'][rows:]))
+
+
+def split_update_columns(item, columns):
+    """
+        Split a single row range update into parts of at most COLUMNS cells.
+
+        Parameter:
+            item [Dict]             -   Dictionary with 'range' & 'values'
+            columns [Int]           -   Maximum amount of columns per part
+
+        Return:
+            [List]                  -   Dictionaries with 'range' & 'values'
+    """
+    bounds = parse_range(item['range'])
+    values = item['values'][0] if item['values'] else []
+    return [
+        {
+            'range': build_range(
+                start_col=col, start_row=bounds['start_row'],
+                end_col=min(col + columns - 1, bounds['end_col']),
+                end_row=bounds['start_row'], sheet=bounds['sheet']),
+            'values': [values[col - bounds['start_col']:
+                              col - bounds['start_col'] + columns]]
+        }
+        for col in range(bounds['start_col'], bounds['end_col'] + 1, columns)
+    ]
+
+
+def chunk_cell_updates(data, max_cells):
+    """
+        Group range updates into chunks of at most MAX_CELLS values, one
+        chunk per batch request. Merged ranges exceeding the free space of a
+        chunk are split by rows (and rows wider than MAX_CELLS by columns),
+        so that the size of a request doesn't depend on the merging.
+
+        Parameter:
+            data [List]             -   Dictionaries with 'range' & 'values'
+            max_cells [Int]         -   Maximum amount of values per chunk
+
+        Return:
+            [List]                  -   Lists of range updates
+    """
+    chunks = []
+    current = []
+    free = max_cells
+    for item in data:
+        rest = item
+        while rest is not None:
+            cells = count_cells(rest)
+            if cells <= free:
+                current.append(rest)
+                free -= cells
+                break
+            bounds = parse_range(rest['range'])
+            width = bounds['end_col'] - bounds['start_col'] + 1
+            rows = free // width
+            if rows:
+                (head, rest) = split_update_rows(item=rest, rows=rows)
+                current.append(head)
+                free -= count_cells(head)
+                continue
+            if current:
+                chunks.append(current)
+                current = []
+                free = max_cells
+                continue
+            # a single row is wider than a whole chunk
+            (head, rest) = split_update_rows(item=rest, rows=1)
+            for part in split_update_columns(item=head, columns=max_cells):
+                chunks.append([part])
+    if current:
+        chunks.append(current)
+    return chunks
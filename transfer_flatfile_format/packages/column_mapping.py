@@ -0,0 +1,138 @@
+"""
+    transfer_flatfile_format
+    Move data inbetween different flatfile formats to the correct postion.
+    Copyright (C) 2020  Sebastian Fricke, Panasiam
+
+    This program is free software: you can redistribute it and/or modify
+    it under the terms of the GNU Affero General Public License as published
+    by the Free Software Foundation, either version 3 of the License, or
+    (at your option) any later version.
+
+    This program is distributed in the hope that it will be useful,
+    but WITHOUT ANY WARRANTY; without even the implied warranty of
+    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+    GNU Affero General Public License for more details.
+
+    You should have received a copy of the GNU Affero General Public License
+    along with this program.  If not, see <https://www.gnu.org/licenses/>.
+"""
+
+import os
+import re
+import pandas
+
+
+def load_mapping_file(path, mapping):
+    """
+        Add the rows of a ';' separated mapping file to MAPPING.
+        Columns: 'sheet', 'source' and the optional 'regex' (y/n).
+        For regex rows, 'sheet' is a regular expression matched against the
+        complete google sheet header and 'source' a template using the groups
+        of the expression (e.g. bullet_point(\\d) ; bullet_point_\\1).
+
+        Parameter:
+            path [String]       -   Location of the mapping file
+            mapping [Dict]      -   'aliases' & 'patterns' to extend
+    """
+    frame = pandas.read_csv(path, sep=';', dtype=str, keep_default_na=False)
+    if 'sheet' not in frame.columns or 'source' not in frame.columns:
+        print(f"WARNING: column mapping file {path} requires a 'sheet' and "
+              "a 'source' column")
+        return
+    if 'regex' not in frame.columns:
+        frame['regex'] = ''
+
+    for sheet, source, regex in zip(frame['sheet'], frame['source'],
+                                    frame['regex']):
+        sheet = sheet.strip()
+        source = source.strip()
+        if not sheet or not source:
+            continue
+        if regex.strip().lower()[:1] == 'y':
+            try:
+                mapping['patterns'].append((re.compile(sheet), source))
+            except re.error as err:
+                print(f"WARNING: invalid column pattern [{sheet}]: {err}")
+            continue
+        mapping['aliases'].setdefault(sheet, []).append(source)
+
+
+def get_column_mapping(config):
+    """
+        Read the aliases for renamed columns from the 'Column_mapping' section
+        of the config, and the optional mapping file referenced by the
+        'file' option.
+
+        Example:
+            [Column_mapping]
+            file=/path/to/mapping.csv
+            item_name=product_name,title
+
+        Parameter:
+            config [ConfigParser object]
+
+        Return:
+            [Dict]              -   'aliases': sheet header => [source headers]
+                                    'patterns': [(regex, source template)]
+    """
+    mapping = {'aliases': {}, 'patterns': []}
+
+    if not config or 'Column_mapping' not in config.sections():
+        return mapping
+
+    # raw: '%' is a regular character within the headers
+    for option, value in config.items('Column_mapping', raw=True):
+        if option == 'file':
+            continue
+        mapping['aliases'][option] = [
+            x.strip() for x in value.split(',') if x.strip()
+        ]
+
+    if config.has_option(section='Column_mapping', option='file'):
+        path = config.get('Column_mapping', 'file', raw=True)
+        if os.path.exists(path):
+            load_mapping_file(path=path, mapping=mapping)
+        else:
+            print(f"WARNING: column mapping file {path} not found")
+
+    return mapping
+
+
+def resolve_column_map(sheet_columns, source_columns, mapping):
+    """
+        Decide once, which column of the source fills which column of the
+        google sheet. Identical headers are preferred, then the aliases (in
+        the configured order) and finally the patterns.
+
+        Parameter:
+            sheet_columns [List]    -   Headers of the google sheet
+            source_columns [List]   -   Headers of the source flatfile
+            mapping [Dict]          -   Result of get_column_mapping
+
+        Return:
+            [Dict]                  -   sheet header => source header, only
+                                        for headers found within the source
+    """
+    available = set(source_columns)
+    column_map = {}
+
+    for header in sheet_columns:
+        if header in available:
+            column_map[header] = header
+            continue
+        for alias in mapping['aliases'].get(header, []):
+            if alias in available:
+                column_map[header] = alias
+                break
+        if header in column_map:
+            continue
+        for pattern, template in mapping['patterns']:
+            match = pattern.fullmatch(header)
+            if not match:
+                continue
+            source = match.expand(template)
+            if source in available:
+                column_map[header] = source
+                break
+
+    return column_map
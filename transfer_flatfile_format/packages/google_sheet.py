@@ -19,63 +19,49 @@
 
 import sys
 import os
-import math
+import getpass
 import pickle
 from itertools import islice
 import pandas
-import numpy as np
 
 from googleapiclient.discovery import build
 from google_auth_oauthlib.flow import InstalledAppFlow
 from google.auth.transport.requests import Request
 
+from transfer_flatfile_format.packages.a1_notation import (
+    build_column_table, build_range, build_row_range,
+    merge_cell_updates, split_cell_updates, chunk_cell_updates
+)
+from transfer_flatfile_format.packages.row_selection import select_rows
+
 SCOPES = ['https://www.googleapis.com/auth/spreadsheets']
 
-LEN_ALPHABET = 26
 SKU_COLUMN = 1
 BRAND_COLUMN = 2
 NAME_COLUMN = 5
 HEADER_ROW = 3
-
-USER = os.getlogin()
+# Amount of rows read from the google sheet
+READ_ROWS = 2400
+# Amount of values per batchUpdate request
+WRITE_CHUNK_SIZE = 3000
+# Amount of ranges per batchGet request of the conflict check
+CHECK_CHUNK_SIZE = 100
+
+try:
+    USER = os.getlogin()
+except OSError:
+    # no controlling terminal (service, cronjob)
+    USER = getpass.getuser()
 if sys.platform == 'linux':
     DATA_DIR = os.path.join('/', 'home', str(f'{USER}'),
                             '.transfer_flatfile_format_data/')
-    if not os.path.exists(DATA_DIR):
-        os.mkdir(DATA_DIR)
 elif sys.platform == 'win32':
     DATA_DIR = os.path.join('C:\\', 'Users', str(f'{USER}'),
                             '.transfer_flatfile_format_data/')
-    if not os.path.exists(DATA_DIR):
-        os.mkdir(DATA_DIR)
 CREDENTIAL_PATH = os.path.join(DATA_DIR, '.credentials.json')
 TOKEN_PATH = os.path.join(DATA_DIR, 'token.pickle')
 
 
-def build_sheet_range(column, max_row, range_column=''):
-    """
-        Specify the area within the google sheet used for reading/writing.
-
-        Parameters:
-            column [String]         -   Start column on the sheet ('A' etc.)
-            max_row [Integer]       -   Amount of rows for the range
-            range_column [String]   -   End column on the sheet
-                                        (To create a horizontal-vertical
-                                         range (A1:E2))
-
-        Return:
-            [String]                -   Example: 'A1:E5' (A1, A2, ... , E4, E5)
-    """
-    if max_row:
-        if not range_column:
-            return str(f'{column}1:{column}{max_row}')
-        return str(f'{column}1:{range_column}{max_row}')
-    print("No specified amount of rows to read, default to range: {0}".format(
-        'A1:E20'))
-    print("Check the config.ini file to adjust the range")
-    return 'A1:E20'
-
-
 def fill_up_values(val, maximum):
     """
         Append empty values to a list for the specified range.
@@ -92,27 +78,6 @@ def fill_up_values(val, maximum):
     return val
 
 
-def build_column_name(column_enum):
-    """
-        Parse a letter combination from a give 0-indexed column index number.
-        example: 27 => 'AB', 3 => 'D', 0 => 'A'
-
-        Parameter:
-            column_enum [Int]   -   index number of the column
-
-        Return:
-            [String]
-    """
-    a_const = ord('A')
-    quotient = math.floor(column_enum / LEN_ALPHABET)
-
-    if column_enum > LEN_ALPHABET - 1:
-        first = chr(a_const + quotient - 1)
-        second = chr(a_const + (column_enum - (quotient * LEN_ALPHABET)))
-        return first + second
-    return chr(a_const + column_enum)
-
-
 def write_chunks(data, size=25):
     """
         Split the data for the batch write to the google sheet into smaller
@@ -155,6 +120,7 @@ def get_google_credentials():
             creds = flow.run_local_server(port=0)
 
         try:
+            os.makedirs(DATA_DIR, exist_ok=True)
             with open(TOKEN_PATH, 'wb') as token:
                 pickle.dump(creds, token)
         except PermissionError:
@@ -163,23 +129,40 @@ def get_google_credentials():
     return creds
 
 
-def read_google_sheet(creds, sheet_id):
+def build_spreadsheets(creds):
+    """
+        Create the spreadsheets resource of the google sheets API, which
+        can be reused for every request.
+
+        Parameter:
+            creds [Google Sheet credentials]
+
+        Return:
+            [Google Sheet spreadsheets resource]
+    """
+    service = build('sheets', 'v4', credentials=creds)
+    return service.spreadsheets()
+
+
+def read_google_sheet(creds, sheet_id, sheet=None):
     """
         Open the sheet with the @sheet_id.
 
         Parameter:
             creds [Google Sheet credentials]
             sheet_id [String]       -   Identification of the google sheet
+            sheet [Google Sheet spreadsheets resource]
+                                    -   prebuilt resource, created from CREDS
+                                        when missing
 
         Return:
             [Dict] : Response from google sheets API
     """
-    service = build('sheets', 'v4', credentials=creds)
-    sheet_range = [
-        build_sheet_range(column='A', max_row='2400', range_column='FH')
-    ]
+    if sheet is None:
+        sheet = build_spreadsheets(creds=creds)
+    # whole rows, so that every column is read regardless of the width
+    sheet_range = [build_row_range(start_row=1, end_row=READ_ROWS)]
 
-    sheet = service.spreadsheets()
     result = sheet.values().batchGet(spreadsheetId=sheet_id,
                                      ranges=sheet_range).execute()
     ranges = result['valueRanges']
@@ -196,57 +179,82 @@ def read_google_sheet(creds, sheet_id):
     return ranges
 
 
-def read_incomplete_data(creds, sheet_id):
+def parse_sheet_values(values):
+    """
+        Convert the values of the google sheet to a dataframe, with the
+        headers from the third row and every row containing a SKU. Missing
+        values are replaced with empty strings.
+
+        Parameter:
+            values [List]           -   Rows of the google sheet
+
+        Result:
+            [DataFrame]             -   including the 0-indexed position of
+                                        the row as 'index'
+    """
+    column_names = values[HEADER_ROW - 1]
+    rows = []
+    for i in range(HEADER_ROW, len(values)):
+        row = fill_up_values(val=list(values[i][:len(column_names)]),
+                             maximum=len(column_names))
+        if not row[SKU_COLUMN]:
+            continue
+        rows.append([x if x else '' for x in row] + [i])
+
+    return pandas.DataFrame(rows, columns=column_names + ['index'])
+
+
+def default_row_selection(column_names):
+    """
+        Select rows, where the 'brand_name' or the 'item_name' field is
+        empty, by the headers located at their usual position.
+
+        Parameter:
+            column_names [List]     -   Headers of the google sheet
+
+        Result:
+            [Dict]                  -   row selection (see row_selection)
+    """
+    columns = [column_names[x] for x in [BRAND_COLUMN, NAME_COLUMN]
+               if x < len(column_names)]
+    return {'combine': 'all',
+            'predicates': [{'type': 'any_empty', 'columns': columns}]}
+
+
+def read_incomplete_data(creds, sheet_id, selection=None, sheet=None):
     """
         Read only rows from the google sheet, that match the following pattern:
             - 'item_sku' field is filled
-            - 'brand_name' & 'item_name' field are not filled => empty values
+            - the conditions of SELECTION are met, by default:
+              'brand_name' or 'item_name' field is not filled => empty values
         Save the data into a dataframe, with all possible columns from the
         google sheet source, even if the values are empty.
 
         Parameter:
             creds [Google Sheet credentials]
             sheet_id [String]       -   Identification of the google sheet
+            selection [Dict]        -   Conditions for the rows
+                                        (row_selection.get_row_selection)
+            sheet [Google Sheet spreadsheets resource]
 
         Result:
             [DataFrame]
 
     """
-    sheet_dict = {}
-
-    ranges = read_google_sheet(creds=creds, sheet_id=sheet_id)
+    ranges = read_google_sheet(creds=creds, sheet_id=sheet_id, sheet=sheet)
     if not ranges:
         return pandas.DataFrame()
 
-    for data in ranges:
-        values = data['values']
-        column_names = values[2]
-        for i in range(HEADER_ROW, len(values)):
-            if not values[i][SKU_COLUMN]:
-                continue
-            # Only take rows which are not filled out
-            if len(values[i]) > 2:
-                if values[i][BRAND_COLUMN] and values[i][NAME_COLUMN]:
-                    continue
-
-            if len(values[i]) < len(column_names):
-                values[i] = fill_up_values(val=values[i],
-                                           maximum=len(column_names))
-            for index, column in enumerate(column_names):
-                if column not in sheet_dict.keys():
-                    sheet_dict[column] = []
-                if not values[i][index]:
-                    sheet_dict[column].append('')
-                else:
-                    sheet_dict[column].append(values[i][index])
-            if 'index' not in sheet_dict.keys():
-                sheet_dict['index'] = []
-            sheet_dict['index'].append(i)
+    frame = parse_sheet_values(values=ranges[0]['values'])
+    if selection is None:
+        selection = default_row_selection(
+            column_names=list(frame.columns[:-1]))
 
-    return pandas.DataFrame(sheet_dict, columns=column_names + ['index'])
+    mask = select_rows(frame=frame, selection=selection)
+    return frame[mask].reset_index(drop=True)
 
 
-def read_specified_column(creds, sheet_id, target_column):
+def read_specified_column(creds, sheet_id, target_column, sheet=None):
     """
         Read every SKU together with the specified column into dataframe.
 
@@ -255,6 +263,7 @@ def read_specified_column(creds, sheet_id, target_column):
             sheet_id [String]       -   Identification of the google sheet
             target_column [String]  -   command line argument specifying the
                                         target column
+            sheet [Google Sheet spreadsheets resource]
 
         Result:
             [DataFrame]
@@ -262,7 +271,7 @@ def read_specified_column(creds, sheet_id, target_column):
     """
     sheet_dict = {}
 
-    ranges = read_google_sheet(creds=creds, sheet_id=sheet_id)
+    ranges = read_google_sheet(creds=creds, sheet_id=sheet_id, sheet=sheet)
     if not ranges:
         return pandas.DataFrame()
 
@@ -297,45 +306,155 @@ def read_specified_column(creds, sheet_id, target_column):
         sheet_dict, columns=['item_sku', 'value', 'index', 'column_index'])
 
 
-def write_google_sheet(creds, sheet_id, frame, exclude):
+def remove_conflicts(sheet, sheet_id, data, snapshot):
     """
-        Write the values to the google sheet, depending on the read option
-        a 'column_index' column is present (when the column option was used),
-        in that case only write that specific column.
+        Read the current state of the ranges from DATA again, right before
+        writing them, and drop every cell that was changed on the google
+        sheet after SNAPSHOT was taken. Only the ranges of DATA are read.
 
         Parameter:
-            creds [Google Sheet credentials]
+            sheet [Google Sheet spreadsheets resource]
             sheet_id [String]   -   Identification of the google sheet
-            frame [DataFrame]   -   difference between source and target
-            exclude [List]      -   columns to exclude from writing to gsheet
-    """
-    data = []
-    data_cols = ['range', 'values']
+            data [List]         -   Dictionaries with 'range' & 'values'
+            snapshot [Dict]     -   (row index, column index) => value
 
-    service = build('sheets', 'v4', credentials=creds)
-    sheet = service.spreadsheets()
-
-    generator = frame.iterrows()
-    for item in generator:
-        if 'column_index' in item[1].keys():
-            range_name = build_column_name(item[1]['column_index'])\
-                + str(item[1]['index']+1)
-            values = [[str(item[1]['value']).replace(str(np.nan), '')]]
-            data.append(dict(zip(data_cols, [range_name, values])))
+        Return:
+            [Tuple]             -   Data without the conflicting cells &
+                                    List of the conflicts
+    """
+    current = {}
+    ranges = [item['range'] for item in data]
+    for part in write_chunks(data=ranges, size=CHECK_CHUNK_SIZE):
+        result = sheet.values().batchGet(spreadsheetId=sheet_id,
+                                         ranges=part).execute()
+        current.update(split_cell_updates(data=[
+            {'range': notation, 'values': value_range.get('values', [])}
+            for notation, value_range in zip(part, result['valueRanges'])
+        ]))
+
+    cells = split_cell_updates(data=data)
+    conflicts = []
+    for position, value in current.items():
+        if position not in snapshot or snapshot[position] == value:
             continue
-        for i, col in enumerate([x for x in frame.columns if x != 'index']):
-            if col == 'item_sku':
-                continue
-            if col in exclude:
-                continue
-            range_name = build_column_name(i) + str(item[1]['index'] + 1)
-            values = [[str(item[1][col]).replace(str(np.nan), '')]]
-            data.append(dict(zip(data_cols, [range_name, values])))
+        conflicts.append({
+            'range': build_range(start_col=position[1],
+                                 start_row=position[0] + 1),
+            'expected': snapshot[position],
+            'found': value,
+            'new': cells.pop(position)
+        })
+
+    if not conflicts:
+        return (data, conflicts)
+    width = max(col for _, col in cells) + 1 if cells else 0
+    return (merge_cell_updates(cells=cells,
+                               column_table=build_column_table(width)),
+            conflicts)
+
+
+def write_update_data(creds, sheet_id, data, chunk_size=WRITE_CHUNK_SIZE,
+                      snapshot=None, sheet=None):
+    """
+        Send prepared range updates to the google sheet in chunks of at most
+        CHUNK_SIZE values, merged ranges are split to fit. When a SNAPSHOT
+        of the previous values is given, skip cells that were modified on
+        the sheet in the meantime.
 
-    for item in write_chunks(data=data, size=3000):
+        Parameter:
+            creds [Google Sheet credentials]
+            sheet_id [String]   -   Identification of the google sheet
+            data [List]         -   Dictionaries with 'range' & 'values'
+            chunk_size [Int]    -   Amount of values per batchUpdate request
+            snapshot [Dict]     -   (row index, column index) => value
+            sheet [Google Sheet spreadsheets resource]
+
+        Return:
+            [List]              -   Cells skipped because of a conflict
+    """
+    conflicts = []
+    if sheet is None:
+        sheet = build_spreadsheets(creds=creds)
+
+    for item in chunk_cell_updates(data=data, max_cells=chunk_size):
+        if snapshot:
+            # the check reads back exactly the ranges of this chunk
+            (item, found) = remove_conflicts(sheet=sheet, sheet_id=sheet_id,
+                                             data=item, snapshot=snapshot)
+            conflicts += found
+            if not item:
+                continue
         body = {'valueInputOption': 'RAW', 'data': item}
         response = sheet.values().batchUpdate(spreadsheetId=sheet_id,
                                               body=body).execute()
 
         if not 'totalUpdatedRows' in response.keys():
             print("WARNING: No updates were performed.")
+
+    if conflicts:
+        print(f"WARNING: Skipped {len(conflicts)} cells, which were changed "
+              "on the google sheet during the transfer.")
+    return conflicts
+
+
+class GoogleSheet:
+    """
+        Access to a single google sheet, as used by the TransferEngine.
+
+        Parameter:
+            creds [Google Sheet credentials]
+            sheet_id [String]   -   Identification of the google sheet
+            selection [Dict]    -   Conditions for the rows to read without
+                                    a specific column
+            sheet [Google Sheet spreadsheets resource]
+                                -   resource used for every request, built
+                                    once from CREDS when missing
+            chunk_size [Int]    -   Amount of values per batchUpdate request
+    """
+    def __init__(self, creds, sheet_id, selection=None, sheet=None,
+                 chunk_size=WRITE_CHUNK_SIZE):
+        self.creds = creds
+        self.sheet_id = sheet_id
+        self.selection = selection
+        self.chunk_size = chunk_size
+        if sheet is None:
+            sheet = build_spreadsheets(creds=creds)
+        self.sheet = sheet
+
+    def read(self, column=None):
+        """
+            Read the rows for the transfer, every row with a SKU for a
+            specific COLUMN, otherwise only the incomplete rows.
+
+            Parameter:
+                column [String]     -   Name of the target column
+
+            Return:
+                [DataFrame]
+        """
+        if column:
+            return read_specified_column(creds=self.creds,
+                                         sheet_id=self.sheet_id,
+                                         target_column=column,
+                                         sheet=self.sheet)
+        return read_incomplete_data(creds=self.creds, sheet_id=self.sheet_id,
+                                    selection=self.selection,
+                                    sheet=self.sheet)
+
+    def write(self, data, snapshot=None, chunk_size=None):
+        """
+            Send the range updates to the google sheet.
+
+            Parameter:
+                data [List]         -   Dictionaries with 'range' & 'values'
+                snapshot [Dict]     -   (row index, column index) => value
+                chunk_size [Int]    -   Amount of values per batchUpdate,
+                                        CHUNK_SIZE of the sheet by default
+
+            Return:
+                [List]              -   Cells skipped because of a conflict
+        """
+        return write_update_data(creds=self.creds, sheet_id=self.sheet_id,
+                                 data=data,
+                                 chunk_size=chunk_size or self.chunk_size,
+                                 snapshot=snapshot, sheet=self.sheet)
@@ -0,0 +1,169 @@
+"""
+    transfer_flatfile_format
+    Move data inbetween different flatfile formats to the correct postion.
+    Copyright (C) 2020  Sebastian Fricke, Panasiam
+
+    This program is free software: you can redistribute it and/or modify
+    it under the terms of the GNU Affero General Public License as published
+    by the Free Software Foundation, either version 3 of the License, or
+    (at your option) any later version.
+
+    This program is distributed in the hope that it will be useful,
+    but WITHOUT ANY WARRANTY; without even the implied warranty of
+    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+    GNU Affero General Public License for more details.
+
+    You should have received a copy of the GNU Affero General Public License
+    along with this program.  If not, see <https://www.gnu.org/licenses/>.
+"""
+
+import os
+import re
+import warnings
+import pandas
+
+COLUMN_PREDICATES = ['any_empty', 'all_empty', 'any_filled', 'all_filled']
+PATTERN_PREDICATES = ['match', 'not_match']
+
+
+def get_row_selection(config):
+    """
+        Read the conditions for the rows of the google sheet, which are
+        filled by a transfer, from the 'Row_selection' section of the config.
+        Options starting with 'match' or 'not_match' can be used multiple
+        times (e.g. match_color, match_size).
+
+        Example:
+            [Row_selection]
+            combine=all
+            any_empty=brand_name,item_name
+            match_color=color_name:^(red|blue)$
+            not_match_parent=parent_child:^parent$
+            sku_list=/path/to/skus.txt
+
+        Parameter:
+            config [ConfigParser object]
+
+        Return:
+            [Dict]              -   'combine' ('all'/'any') & 'predicates'
+                                    or None without a 'Row_selection' section
+    """
+    if not config or 'Row_selection' not in config.sections():
+        return None
+
+    selection = {'combine': 'all', 'predicates': []}
+    # raw: '%' is a regular character within the patterns
+    for option, value in config.items('Row_selection', raw=True):
+        value = value.strip()
+        if option == 'combine':
+            if value.lower() not in ['all', 'any']:
+                print(f"WARNING: Invalid row selection combine [{value}], "
+                      "using 'all'")
+                continue
+            selection['combine'] = value.lower()
+        elif option in COLUMN_PREDICATES:
+            selection['predicates'].append({
+                'type': option,
+                'columns': [x.strip() for x in value.split(',') if x.strip()]
+            })
+        elif option == 'sku_list':
+            selection['predicates'].append({'type': option, 'path': value})
+        elif option.startswith('not_match') or option.startswith('match'):
+            (column, _, pattern) = value.partition(':')
+            try:
+                regex = re.compile(pattern)
+            except re.error as err:
+                print(f"WARNING: invalid row selection pattern [{pattern}]: "
+                      f"{err}")
+                continue
+            kind = 'not_match' if option.startswith('not_match') else 'match'
+            selection['predicates'].append({
+                'type': kind, 'columns': [column.strip()], 'pattern': regex
+            })
+        else:
+            print(f"WARNING: Unknown row selection option [{option}]")
+
+    return selection
+
+
+def read_sku_list(path):
+    """
+        Read a file with one SKU per line.
+
+        Parameter:
+            path [String]       -   Location of the file
+
+        Return:
+            [Set]
+    """
+    if not os.path.exists(path):
+        print(f"ERROR: SKU list {path} not found")
+        return set()
+    with open(path, 'r', encoding='utf-8') as sku_file:
+        return {line.strip() for line in sku_file if line.strip()}
+
+
+def evaluate_predicate(frame, predicate):
+    """
+        Evaluate a single condition over all rows of the frame at once.
+
+        Parameter:
+            frame [DataFrame]   -   google sheet data, every value a string
+            predicate [Dict]    -   condition from get_row_selection
+
+        Return:
+            [Series]            -   Boolean mask
+    """
+    kind = predicate['type']
+    if kind == 'sku_list':
+        return frame['item_sku'].isin(read_sku_list(path=predicate['path']))
+
+    columns = frame[predicate['columns']]
+    if kind in PATTERN_PREDICATES:
+        with warnings.catch_warnings():
+            # only a match is needed, the groups of the pattern are irrelevant
+            warnings.filterwarnings('ignore', message='.*match groups',
+                                    category=UserWarning)
+            found = columns.iloc[:, 0].str.contains(predicate['pattern'],
+                                                    na=False)
+        return ~found if kind == 'not_match' else found
+
+    empty = columns == ''
+    if kind == 'any_empty':
+        return empty.any(axis=1)
+    if kind == 'all_empty':
+        return empty.all(axis=1)
+    if kind == 'any_filled':
+        return (~empty).any(axis=1)
+    return (~empty).all(axis=1)
+
+
+def select_rows(frame, selection):
+    """
+        Combine the conditions of the row selection to a mask over the
+        google sheet data. Columns are referenced by their header name.
+
+        Parameter:
+            frame [DataFrame]   -   google sheet data, every value a string
+            selection [Dict]    -   Result of get_row_selection
+
+        Return:
+            [Series]            -   Boolean mask, all False if a column
+                                    can't be found within the google sheet
+    """
+    mask = pandas.Series(selection['combine'] == 'all', index=frame.index)
+
+    for predicate in selection['predicates']:
+        missing = [x for x in predicate.get('columns', [])
+                   if x not in frame.columns]
+        if missing:
+            print(f"ERROR: row selection columns {missing} not found @ "
+                  "google sheet.")
+            return pandas.Series(False, index=frame.index)
+        result = evaluate_predicate(frame=frame, predicate=predicate)
+        if selection['combine'] == 'all':
+            mask &= result
+        else:
+            mask |= result
+
+    return mask
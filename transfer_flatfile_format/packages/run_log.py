@@ -0,0 +1,259 @@
+"""
+    transfer_flatfile_format
+    Move data inbetween different flatfile formats to the correct postion.
+    Copyright (C) 2020  Sebastian Fricke, Panasiam
+
+    This program is free software: you can redistribute it and/or modify
+    it under the terms of the GNU Affero General Public License as published
+    by the Free Software Foundation, either version 3 of the License, or
+    (at your option) any later version.
+
+    This program is distributed in the hope that it will be useful,
+    but WITHOUT ANY WARRANTY; without even the implied warranty of
+    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+    GNU Affero General Public License for more details.
+
+    You should have received a copy of the GNU Affero General Public License
+    along with this program.  If not, see <https://www.gnu.org/licenses/>.
+"""
+
+import sqlite3
+import datetime
+import pandas
+
+# Map up to 256MB of the database file into memory for the queries
+MMAP_SIZE = 256 * 1024 * 1024
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS runs (
+    run_id INTEGER PRIMARY KEY AUTOINCREMENT,
+    created TEXT NOT NULL,
+    sheet_id TEXT NOT NULL,
+    source TEXT NOT NULL,
+    mode TEXT NOT NULL,
+    changes INTEGER NOT NULL,
+    status TEXT NOT NULL DEFAULT 'complete'
+);
+CREATE TABLE IF NOT EXISTS changes (
+    run_id INTEGER NOT NULL REFERENCES runs(run_id),
+    row_index INTEGER NOT NULL,
+    column_index INTEGER NOT NULL,
+    sku TEXT NOT NULL,
+    column_name TEXT NOT NULL,
+    old_value TEXT,
+    new_value TEXT NOT NULL
+);
+CREATE INDEX IF NOT EXISTS changes_run ON changes (run_id);
+CREATE INDEX IF NOT EXISTS changes_sku ON changes (sku, run_id);
+CREATE INDEX IF NOT EXISTS runs_created ON runs (created);
+"""
+
+
+def open_run_log(path):
+    """
+        Open (and create if necessary) the run log database.
+
+        Parameter:
+            path [String]       -   Location of the SQLite file
+
+        Return:
+            [sqlite3.Connection]
+    """
+    connection = sqlite3.connect(path)
+    connection.execute(f'PRAGMA mmap_size={MMAP_SIZE}')
+    connection.execute('PRAGMA journal_mode=WAL')
+    connection.executescript(SCHEMA)
+    columns = [x[1] for x in connection.execute('PRAGMA table_info(runs)')]
+    if 'status' not in columns:
+        # run logs created before the status was introduced
+        connection.execute("ALTER TABLE runs ADD COLUMN status TEXT NOT NULL "
+                           "DEFAULT 'complete'")
+    return connection
+
+
+def record_run(path, sheet_id, source, mode, changes, status='complete'):
+    """
+        Append a run with all of its written changes to the log.
+        A run recorded before the write starts has the status 'started',
+        until it is completed with finish_run.
+
+        Parameter:
+            path [String]       -   Location of the SQLite file
+            sheet_id [String]   -   Identification of the google sheet
+            source [String]     -   Original flatfile of the run
+            mode [String]       -   Kind of run (e.g. 'transfer', 'plan')
+            changes [List]      -   Dictionaries with 'row', 'column_index',
+                                    'sku', 'column', 'old' & 'new'
+                                    (sheet_updates.collect_changes)
+            status [String]     -   'started', 'complete' or 'failed'
+
+        Return:
+            [Int]               -   ID of the new run
+    """
+    created = datetime.datetime.now().isoformat(timespec='seconds')
+    connection = open_run_log(path=path)
+    try:
+        with connection:
+            cursor = connection.execute(
+                'INSERT INTO runs (created, sheet_id, source, mode, changes, '
+                'status) VALUES (?, ?, ?, ?, ?, ?)',
+                (created, sheet_id, source, mode, len(changes), status))
+            run_id = cursor.lastrowid
+            connection.executemany(
+                'INSERT INTO changes VALUES (?, ?, ?, ?, ?, ?, ?)',
+                [(run_id, x['row'], x['column_index'], str(x['sku']),
+                  x['column'], x['old'], x['new']) for x in changes])
+    finally:
+        connection.close()
+    return run_id
+
+
+def finish_run(path, run_id, skipped, status='complete'):
+    """
+        Complete a run recorded before the write, by removing the cells,
+        which were skipped during the write, and setting the final status.
+
+        Parameter:
+            path [String]       -   Location of the SQLite file
+            run_id [Int]        -   ID of the run
+            skipped [Set]       -   (row index, column index) of cells that
+                                    were not written
+            status [String]     -   'complete' or 'failed'
+    """
+    connection = open_run_log(path=path)
+    try:
+        with connection:
+            connection.executemany(
+                'DELETE FROM changes WHERE run_id = ? AND row_index = ? '
+                'AND column_index = ?',
+                [(run_id, row, col) for row, col in skipped])
+            connection.execute(
+                'UPDATE runs SET status = ?, changes = (SELECT COUNT(*) '
+                'FROM changes WHERE run_id = ?) WHERE run_id = ?',
+                (status, run_id, run_id))
+    finally:
+        connection.close()
+
+
+def query_frame(path, query, parameters=()):
+    """
+        Run a query against the run log and return the rows as a frame.
+
+        Parameter:
+            path [String]       -   Location of the SQLite file
+            query [String]      -   SQL query
+            parameters [Tuple]  -   Values for the placeholders
+
+        Return:
+            [DataFrame]
+    """
+    connection = open_run_log(path=path)
+    try:
+        return pandas.read_sql_query(query, connection, params=parameters)
+    finally:
+        connection.close()
+
+
+def get_runs(path, limit=20):
+    """
+        List the latest runs.
+
+        Parameter:
+            path [String]       -   Location of the SQLite file
+            limit [Int]         -   Maximum amount of runs
+
+        Return:
+            [DataFrame]
+    """
+    return query_frame(path=path,
+                       query='SELECT * FROM runs ORDER BY run_id DESC '
+                       'LIMIT ?', parameters=(limit,))
+
+
+def get_run(path, run_id):
+    """
+        Get the information about a single run.
+
+        Parameter:
+            path [String]       -   Location of the SQLite file
+            run_id [Int]        -   ID of the run
+
+        Return:
+            [Dict]              -   Empty when the run doesn't exist
+    """
+    runs = query_frame(path=path, query='SELECT * FROM runs WHERE run_id = ?',
+                       parameters=(run_id,))
+    if len(runs.index) == 0:
+        return {}
+    return runs.iloc[0].to_dict()
+
+
+def get_run_changes(path, run_id):
+    """
+        Get every change written by the run RUN_ID.
+
+        Parameter:
+            path [String]       -   Location of the SQLite file
+            run_id [Int]        -   ID of the run
+
+        Return:
+            [DataFrame]
+    """
+    return query_frame(path=path,
+                       query='SELECT * FROM changes WHERE run_id = ? '
+                       'ORDER BY row_index, column_index',
+                       parameters=(run_id,))
+
+
+def get_sku_history(path, sku, days=None):
+    """
+        Get the changes written to the SKU, latest first.
+
+        Parameter:
+            path [String]       -   Location of the SQLite file
+            sku [String]        -   SKU from the google sheet
+            days [Int]          -   Only the runs of the last DAYS days
+
+        Return:
+            [DataFrame]         -   changes with the creation time of the run
+    """
+    since = ''
+    if days:
+        since = (datetime.datetime.now() - datetime.timedelta(days=days))\
+            .isoformat(timespec='seconds')
+    return query_frame(
+        path=path,
+        query='SELECT runs.created, changes.* FROM changes '
+        'JOIN runs ON runs.run_id = changes.run_id '
+        'WHERE changes.sku = ? AND runs.created >= ? '
+        'ORDER BY changes.run_id DESC, changes.column_index',
+        parameters=(sku, since))
+
+
+def build_inverse_changes(path, run_id):
+    """
+        Build the changes, which restore the values from before the run
+        RUN_ID. Cells without a known previous value can't be restored.
+
+        Parameter:
+            path [String]       -   Location of the SQLite file
+            run_id [Int]        -   ID of the run
+
+        Return:
+            [Tuple]             -   Inverse changes (old & new swapped) and
+                                    the amount of cells without previous value
+    """
+    changes = get_run_changes(path=path, run_id=run_id)
+    inverse = []
+    unknown = 0
+    for change in changes.itertuples(index=False):
+        if change.old_value is None or pandas.isna(change.old_value):
+            unknown += 1
+            continue
+        inverse.append({
+            'row': int(change.row_index),
+            'column_index': int(change.column_index),
+            'sku': change.sku, 'column': change.column_name,
+            'old': change.new_value, 'new': change.old_value
+        })
+    return (inverse, unknown)
@@ -0,0 +1,148 @@
+"""
+    transfer_flatfile_format
+    Move data inbetween different flatfile formats to the correct postion.
+    Copyright (C) 2020  Sebastian Fricke, Panasiam
+
+    This program is free software: you can redistribute it and/or modify
+    it under the terms of the GNU Affero General Public License as published
+    by the Free Software Foundation, either version 3 of the License, or
+    (at your option) any later version.
+
+    This program is distributed in the hope that it will be useful,
+    but WITHOUT ANY WARRANTY; without even the implied warranty of
+    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+    GNU Affero General Public License for more details.
+
+    You should have received a copy of the GNU Affero General Public License
+    along with this program.  If not, see <https://www.gnu.org/licenses/>.
+"""
+
+import numpy as np
+
+from transfer_flatfile_format.packages.a1_notation import (
+    build_column_table, merge_cell_updates, parse_range
+)
+
+
+def collect_update_cells(frame, exclude):
+    """
+        Map every cell of the frame, that is supposed to be written to the
+        google sheet, to its position. Depending on the read option a
+        'column_index' column is present (when the column option was used),
+        in that case only the values of that specific column are used.
+
+        Parameter:
+            frame [DataFrame]   -   difference between source and target
+            exclude [List]      -   columns to exclude from writing to gsheet
+
+        Return:
+            [Tuple]             -   (row index, column index) => value
+                                    & amount of columns
+    """
+    cells = {}
+    nan = str(np.nan)
+
+    if 'column_index' in frame.columns:
+        for row, col, value in zip(frame['index'], frame['column_index'],
+                                   frame['value']):
+            cells[(int(row), int(col))] = str(value).replace(nan, '')
+        width = int(frame['column_index'].max()) + 1 if cells else 0
+        return (cells, width)
+
+    columns = [x for x in frame.columns if x != 'index']
+    for i, col in enumerate(columns):
+        if col == 'item_sku':
+            continue
+        if col in exclude:
+            continue
+        for row, value in zip(frame['index'], frame[col]):
+            cells[(int(row), i)] = str(value).replace(nan, '')
+
+    return (cells, len(columns))
+
+
+def build_update_data(frame, exclude):
+    """
+        Collect the cell updates for the google sheet and combine neighbouring
+        cells into rectangular ranges.
+
+        Parameter:
+            frame [DataFrame]   -   difference between source and target
+            exclude [List]      -   columns to exclude from writing to gsheet
+
+        Return:
+            [List]              -   Dictionaries with 'range' & 'values'
+    """
+    (cells, width) = collect_update_cells(frame=frame, exclude=exclude)
+    return merge_cell_updates(cells=cells,
+                              column_table=build_column_table(width))
+
+
+def build_snapshot(frame, exclude):
+    """
+        Remember the values of the cells, which are going to be overwritten,
+        as they were read from the google sheet.
+
+        Parameter:
+            frame [DataFrame]   -   google sheet data before the transfer
+            exclude [List]      -   columns to exclude from writing to gsheet
+
+        Return:
+            [Dict]              -   (row index, column index) => value
+    """
+    return collect_update_cells(frame=frame, exclude=exclude)[0]
+
+
+def collect_changes(frame, exclude, previous, column=None):
+    """
+        Describe every cell, whose value is changed by the write, with its
+        SKU and column name.
+
+        Parameter:
+            frame [DataFrame]   -   difference between source and target
+            exclude [List]      -   columns to exclude from writing to gsheet
+            previous [Dict]     -   (row index, column index) => value before
+                                    the transfer (build_snapshot)
+            column [String]     -   Name of the column, when the frame only
+                                    contains a 'value' column
+
+        Return:
+            [List]              -   Dictionaries with 'row', 'column_index'
+                                    (both 0-indexed), 'sku', 'column', 'old'
+                                    & 'new'
+    """
+    (cells, _) = collect_update_cells(frame=frame, exclude=exclude)
+    skus = dict(zip(frame['index'].astype(int), frame['item_sku']))
+    columns = [x for x in frame.columns if x != 'index']
+
+    changes = []
+    for (row, col), value in sorted(cells.items()):
+        old = previous.get((row, col))
+        if old == value:
+            continue
+        if 'column_index' in frame.columns:
+            name = column or ''
+        else:
+            name = columns[col]
+        changes.append({
+            'row': row, 'column_index': col, 'sku': skus.get(row, ''),
+            'column': name, 'old': old, 'new': value
+        })
+    return changes
+
+
+def conflict_positions(conflicts):
+    """
+        Get the positions of the cells skipped during a write.
+
+        Parameter:
+            conflicts [List]    -   Conflicts returned by the write
+
+        Return:
+            [Set]               -   (row index, column index)
+    """
+    positions = set()
+    for conflict in conflicts:
+        bounds = parse_range(conflict['range'])
+        positions.add((bounds['start_row'] - 1, bounds['start_col']))
+    return positions
@@ -0,0 +1,244 @@
+"""
+    transfer_flatfile_format
+    Move data inbetween different flatfile formats to the correct postion.
+    Copyright (C) 2020  Sebastian Fricke, Panasiam
+
+    This program is free software: you can redistribute it and/or modify
+    it under the terms of the GNU Affero General Public License as published
+    by the Free Software Foundation, either version 3 of the License, or
+    (at your option) any later version.
+
+    This program is distributed in the hope that it will be useful,
+    but WITHOUT ANY WARRANTY; without even the implied warranty of
+    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+    GNU Affero General Public License for more details.
+
+    You should have received a copy of the GNU Affero General Public License
+    along with this program.  If not, see <https://www.gnu.org/licenses/>.
+"""
+
+import re
+from collections import Counter
+
+NGRAM_SIZE = 3
+# n-grams shared by more SKUs are too common to narrow down the candidates
+MAX_POSTINGS = 1000
+MAX_CANDIDATES = 10
+DEFAULT_SUFFIX_PATTERN = r'[-_ ]?(?:parent|child)$'
+NORMALIZATION_RULES = ['case', 'whitespace', 'leading_zeros', 'suffix']
+
+
+def get_sku_matching_options(config):
+    """
+        Read the SKU normalization options from the 'Sku_matching' section
+        of the config.
+
+        Example:
+            [Sku_matching]
+            rules=case,whitespace,leading_zeros,suffix
+            suffix_pattern=[-_ ]?(?:parent|child)$
+            fuzzy=y
+            min_confidence=0.8
+
+        Parameter:
+            config [ConfigParser object]
+
+        Return:
+            [Dict]
+    """
+    options = {
+        'rules': [], 'suffix_pattern': DEFAULT_SUFFIX_PATTERN,
+        'fuzzy': False, 'min_confidence': 0.8
+    }
+
+    if not config or 'Sku_matching' not in config.sections():
+        return options
+
+    section = config['Sku_matching']
+    if section.get('rules', ''):
+        for rule in section['rules'].split(','):
+            rule = rule.strip()
+            if rule not in NORMALIZATION_RULES:
+                print(f"WARNING: Unknown SKU normalization rule [{rule}]")
+                continue
+            options['rules'].append(rule)
+    if section.get('suffix_pattern', ''):
+        options['suffix_pattern'] = section['suffix_pattern']
+    if section.get('fuzzy', 'n').lower()[:1] == 'y':
+        options['fuzzy'] = True
+    if section.get('min_confidence', ''):
+        options['min_confidence'] = float(section['min_confidence'])
+
+    return options
+
+
+def normalize_sku(sku, rules, suffix=None):
+    """
+        Reduce a SKU to a comparable form, by applying the configured rules:
+            case            -   ignore upper/lower case
+            whitespace      -   remove any whitespace
+            leading_zeros   -   remove leading zeros
+            suffix          -   remove a parent/child suffix (SUFFIX)
+
+        Parameter:
+            sku [String]        -   SKU from the flatfile or google sheet
+            rules [List]        -   Names of the rules to apply
+            suffix [Pattern]    -   compiled regex for the 'suffix' rule
+
+        Return:
+            [String]
+    """
+    sku = str(sku)
+    if 'whitespace' in rules:
+        sku = re.sub(r'\s+', '', sku)
+    if 'case' in rules:
+        sku = sku.upper()
+    if 'suffix' in rules and suffix is not None:
+        sku = suffix.sub('', sku)
+    if 'leading_zeros' in rules:
+        sku = sku.lstrip('0') or sku[-1:]
+    return sku
+
+
+def get_ngrams(key):
+    """
+        Split a normalized SKU into overlapping character n-grams, padded
+        at the borders to give short SKUs a chance to match.
+
+        Parameter:
+            key [String]        -   normalized SKU
+
+        Return:
+            [Set]
+    """
+    padded = f'^{key}$'
+    if len(padded) <= NGRAM_SIZE:
+        return {padded}
+    return {padded[i:i + NGRAM_SIZE]
+            for i in range(len(padded) - NGRAM_SIZE + 1)}
+
+
+def build_sku_index(skus, options):
+    """
+        Prepare the lookup structures for the SKUs of the source flatfile
+        once, so that each lookup takes constant time (exact/normalized) or
+        only compares against SKUs sharing n-grams (fuzzy).
+
+        Parameter:
+            skus [List/Series]  -   SKUs, the position is the row position
+                                    of the SKU within the source
+            options [Dict]      -   Options from get_sku_matching_options
+
+        Return:
+            [Dict]              -   Index used by lookup_sku
+    """
+    skus = list(skus)
+    suffix = None
+    if 'suffix' in options['rules']:
+        suffix = re.compile(options['suffix_pattern'], re.IGNORECASE)
+
+    index = {
+        'rules': options['rules'], 'suffix': suffix,
+        'fuzzy': options['fuzzy'],
+        'min_confidence': options['min_confidence'],
+        'exact': {}, 'normalized': {}, 'ngrams': {}
+    }
+
+    for position, sku in enumerate(skus):
+        if not isinstance(sku, str) or not sku:
+            continue
+        index['exact'].setdefault(sku, position)
+        if not index['rules'] and not index['fuzzy']:
+            continue
+        key = normalize_sku(sku=sku, rules=index['rules'], suffix=suffix)
+        known = index['normalized'].get(key, position)
+        # Different SKUs with the same normalized form are ambiguous
+        if known is not None and skus[known] != sku:
+            index['normalized'][key] = None
+        else:
+            index['normalized'].setdefault(key, position)
+
+    if index['fuzzy']:
+        for key in index['normalized'].keys():
+            for gram in get_ngrams(key=key):
+                index['ngrams'].setdefault(gram, []).append(key)
+
+    return index
+
+
+def find_fuzzy_candidate(index, key):
+    """
+        Search for the normalized SKU with the most n-grams in common with
+        KEY and rate the similarity with the dice coefficient.
+
+        Parameter:
+            index [Dict]        -   Index from build_sku_index
+            key [String]        -   normalized SKU
+
+        Return:
+            [Tuple]             -   (normalized SKU, confidence) or
+                                    (None, 0.0)
+    """
+    grams = get_ngrams(key=key)
+    counter = Counter()
+    for gram in grams:
+        postings = index['ngrams'].get(gram, [])
+        if len(postings) > MAX_POSTINGS:
+            continue
+        counter.update(postings)
+
+    best = (None, 0.0)
+    for candidate, _ in counter.most_common(MAX_CANDIDATES):
+        if index['normalized'][candidate] is None:
+            continue
+        candidate_grams = get_ngrams(key=candidate)
+        confidence = 2 * len(grams & candidate_grams) /\
+            (len(grams) + len(candidate_grams))
+        if confidence > best[1]:
+            best = (candidate, confidence)
+    return best
+
+
+def lookup_sku(index, skus):
+    """
+        Locate the row position of one of the SKUS within the source.
+        All SKUS are compared exactly first, then by their normalized form
+        and finally (if enabled) by a fuzzy match of the normalized form.
+        That way an exact match of an alternative SKU wins over a guess.
+
+        Parameter:
+            index [Dict]        -   Index from build_sku_index
+            skus [List]         -   SKU from the google sheet followed by
+                                    alternatives
+
+        Return:
+            [Tuple]             -   (position, confidence, method) with
+                                    position -1 when nothing was found
+    """
+    skus = [sku for sku in skus if isinstance(sku, str) and sku]
+    for sku in skus:
+        if sku in index['exact']:
+            return (index['exact'][sku], 1.0, 'exact')
+    if not index['rules'] and not index['fuzzy']:
+        return (-1, 0.0, '')
+
+    keys = [normalize_sku(sku=sku, rules=index['rules'],
+                          suffix=index['suffix']) for sku in skus]
+    for key in keys:
+        position = index['normalized'].get(key)
+        if position is not None:
+            return (position, 1.0, 'normalized')
+
+    if not index['fuzzy']:
+        return (-1, 0.0, '')
+    best = (None, 0.0)
+    for key in keys:
+        if key in index['normalized']:
+            # ambiguous normalized SKU, guessing would hide the ambiguity
+            continue
+        candidate = find_fuzzy_candidate(index=index, key=key)
+        if candidate[1] > best[1]:
+            best = candidate
+    if best[0] is not None and best[1] >= index['min_confidence']:
+        return (index['normalized'][best[0]], best[1], 'fuzzy')
+    return (-1, 0.0, '')
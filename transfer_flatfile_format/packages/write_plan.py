@@ -0,0 +1,202 @@
+"""
+    transfer_flatfile_format
+    Move data inbetween different flatfile formats to the correct postion.
+    Copyright (C) 2020  Sebastian Fricke, Panasiam
+
+    This program is free software: you can redistribute it and/or modify
+    it under the terms of the GNU Affero General Public License as published
+    by the Free Software Foundation, either version 3 of the License, or
+    (at your option) any later version.
+
+    This program is distributed in the hope that it will be useful,
+    but WITHOUT ANY WARRANTY; without even the implied warranty of
+    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+    GNU Affero General Public License for more details.
+
+    You should have received a copy of the GNU Affero General Public License
+    along with this program.  If not, see <https://www.gnu.org/licenses/>.
+"""
+
+import gzip
+import json
+import datetime
+
+from transfer_flatfile_format.packages.a1_notation import (
+    parse_range, chunk_cell_updates, split_cell_updates
+)
+
+PLAN_VERSION = 1
+
+
+def open_plan_file(path, mode):
+    """
+        Open a plan file as text, files ending with '.gz' are compressed.
+
+        Parameter:
+            path [String]       -   Location of the plan file
+            mode [String]       -   'r' or 'w'
+
+        Return:
+            [File object]
+    """
+    if path.endswith('.gz'):
+        return gzip.open(path, mode + 't', encoding='utf-8')
+    return open(path, mode, encoding='utf-8')
+
+
+def range_positions(notation):
+    """
+        List the cell positions of a bounded range row by row.
+
+        Parameter:
+            notation [String]   -   A1 notation range
+
+        Return:
+            [List]              -   Lists of (row index, column index)
+    """
+    bounds = parse_range(notation)
+    return [
+        [(row - 1, col)
+         for col in range(bounds['start_col'], bounds['end_col'] + 1)]
+        for row in range(bounds['start_row'], bounds['end_row'] + 1)
+    ]
+
+
+def build_write_plan(sheet_id, data, chunk_size, snapshot=None,
+                     check_size=None):
+    """
+        Describe the complete set of updates for a google sheet write,
+        without sending them.
+
+        Parameter:
+            sheet_id [String]   -   Identification of the google sheet
+            data [List]         -   Dictionaries with 'range' & 'values'
+            chunk_size [Int]    -   Amount of values per batchUpdate request
+            snapshot [Dict]     -   (row index, column index) => value,
+                                    previous values used to detect conflicts
+            check_size [Int]    -   Amount of ranges per batchGet request of
+                                    the conflict check
+
+        Return:
+            [Dict]              -   'header' with statistics, 'data' &
+                                    'snapshot'
+    """
+    cells = sum(len(row) for item in data for row in item['values'])
+    # the same chunks as sent by google_sheet.write_update_data
+    chunks = chunk_cell_updates(data=data, max_cells=chunk_size)
+    check_calls = 0
+    if snapshot and check_size:
+        # every write chunk re-reads its own ranges before the batchUpdate
+        check_calls = sum(-(-len(chunk) // check_size) for chunk in chunks)
+    header = {
+        'version': PLAN_VERSION,
+        'sheet_id': sheet_id,
+        'created': datetime.datetime.now().isoformat(timespec='seconds'),
+        'chunk_size': chunk_size,
+        'ranges': len(data),
+        'cells': cells,
+        'api_calls': len(chunks),
+        'check_calls': check_calls,
+        'checked': bool(snapshot)
+    }
+    return {'header': header, 'data': data, 'snapshot': snapshot or {}}
+
+
+def save_write_plan(plan, path):
+    """
+        Write the plan as JSON lines, the first line contains the header
+        every following line a single range update. The previous values from
+        the snapshot are stored next to the new values as 'old'.
+
+        Parameter:
+            plan [Dict]         -   plan from build_write_plan
+            path [String]       -   Location of the plan file
+    """
+    with open_plan_file(path, 'w') as plan_file:
+        plan_file.write(json.dumps(plan['header'],
+                                   separators=(',', ':')) + '\n')
+        for item in plan['data']:
+            if plan['snapshot']:
+                item = dict(item)
+                item['old'] = [
+                    [plan['snapshot'].get(position) for position in row]
+                    for row in range_positions(notation=item['range'])
+                ]
+            plan_file.write(json.dumps(item, separators=(',', ':')) + '\n')
+
+
+def load_write_plan(path):
+    """
+        Read a plan saved by save_write_plan.
+
+        Parameter:
+            path [String]       -   Location of the plan file
+
+        Return:
+            [Dict]              -   'header', 'data' & 'snapshot' or an
+                                    empty dict if the file is not a valid plan
+    """
+    with open_plan_file(path, 'r') as plan_file:
+        try:
+            header = json.loads(plan_file.readline())
+        except ValueError:
+            header = {}
+        if header.get('version') != PLAN_VERSION:
+            print(f"ERROR: {path} is not a valid write plan")
+            return {}
+        data = [json.loads(line) for line in plan_file if line.strip()]
+
+    snapshot = {}
+    for item in data:
+        old = item.pop('old', None)
+        if old is None:
+            continue
+        for positions, values in zip(range_positions(item['range']), old):
+            for position, value in zip(positions, values):
+                if value is not None:
+                    snapshot[position] = value
+
+    if len(data) != header['ranges']:
+        print(f"ERROR: write plan {path} is incomplete, expected "
+              f"{header['ranges']} ranges, found {len(data)}")
+        return {}
+    return {'header': header, 'data': data, 'snapshot': snapshot}
+
+
+def plan_changes(plan):
+    """
+        Describe the cells changed by writing a plan, the SKUs and column
+        names are not part of a plan.
+
+        Parameter:
+            plan [Dict]         -   plan from load_write_plan
+
+        Return:
+            [List]              -   Changed cells
+                                    (sheet_updates.collect_changes)
+    """
+    changes = []
+    for (row, col), value in sorted(split_cell_updates(plan['data']).items()):
+        old = plan['snapshot'].get((row, col))
+        if old == value:
+            continue
+        changes.append({'row': row, 'column_index': col, 'sku': '',
+                        'column': '', 'old': old, 'new': value})
+    return changes
+
+
+def print_plan_summary(plan):
+    """
+        Display the statistics of a write plan on the command line.
+
+        Parameter:
+            plan [Dict]         -   plan from build_write_plan
+    """
+    header = plan['header']
+    print(f"Write plan for sheet {header['sheet_id']}:")
+    print(f"\t{header['cells']} cells in {header['ranges']} ranges")
+    print(f"\t{header['api_calls']} batchUpdate calls "
+          f"(up to {header['chunk_size']} values each)")
+    if header.get('check_calls'):
+        print(f"\t{header['check_calls']} batchGet calls for the conflict "
+              "check")